@@ -1,10 +1,29 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
-import time
+import asyncio
 import random
+import re
 
-app = FastAPI()
+# Query keyword -> mock market size. Compiled once into a single case-insensitive
+# alternation so classification is one regex scan regardless of rule count. Each
+# keyword gets a named group and the hit is looked up by `lastgroup`, since the
+# matched text can differ from the keyword under IGNORECASE unicode folding
+# (e.g. "K" for the Kelvin sign) and would not be a dict key.
+DEFAULT_MARKET_SIZE = "$12.5 Billion"
+MARKET_SIZE_RULES = {
+    "breast": "$29.2 Billion",
+}
+_MARKET_SIZES = list(MARKET_SIZE_RULES.values())
+MARKET_SIZE_PATTERN = re.compile(
+    "|".join(f"(?P<r{i}>{re.escape(keyword)})" for i, keyword in enumerate(MARKET_SIZE_RULES)),
+    re.IGNORECASE
+)
+
+# orjson serializes the plain-dict payloads directly; no response_model means no
+# pydantic validation pass on the way out.
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Enable CORS to allow requests from the frontend file
 app.add_middleware(
@@ -15,13 +34,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.get("/")
-def read_root():
+@app.get("/", response_class=ORJSONResponse, response_model=None)
+async def read_root():
     return {"message": "PharmaShe API System Online"}
 
-@app.get("/api/external/test-integrations")
-def test_integrations():
-    time.sleep(1)  # Simulate network delay
+@app.get("/api/external/test-integrations", response_class=ORJSONResponse, response_model=None)
+async def test_integrations():
+    await asyncio.sleep(1)  # Simulate network delay
     return {
         "results": {
             "clinical_trials": {"count": 1245},
@@ -31,21 +50,20 @@ def test_integrations():
         }
     }
 
-@app.get("/api/reports/generate")
-def generate_report():
-    time.sleep(1.5)
+@app.get("/api/reports/generate", response_class=ORJSONResponse, response_model=None)
+async def generate_report():
+    await asyncio.sleep(1.5)
     return {
         "report_id": f"RPT-{random.randint(1000,9999)}",
         "estimated_completion": "2 minutes"
     }
 
-@app.get("/api/research/query")
-def research_query(query: str):
-    time.sleep(2)
+@app.get("/api/research/query", response_class=ORJSONResponse, response_model=None)
+async def research_query(query: str):
+    await asyncio.sleep(2)
     # Return dynamic mock data based on query
-    market_size = "$12.5 Billion"
-    if "breast" in query.lower():
-        market_size = "$29.2 Billion"
+    hit = MARKET_SIZE_PATTERN.search(query)
+    market_size = _MARKET_SIZES[int(hit.lastgroup[1:])] if hit else DEFAULT_MARKET_SIZE
     
     return {
         "query": query,
@@ -72,4 +90,4 @@ def research_query(query: str):
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
\ No newline at end of file
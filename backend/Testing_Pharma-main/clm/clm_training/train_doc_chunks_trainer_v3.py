@@ -1,10 +1,14 @@
 import os
 import glob
-from typing import Iterator, List, Dict
+import hashlib
+import shutil
+from dataclasses import dataclass
+from typing import List, Dict
 
 from transformers.trainer_utils import get_last_checkpoint
 from datetime import timedelta
 
+import numpy as np
 import torch
 from datasets import Dataset, Features, Sequence, Value
 from transformers import (
@@ -13,10 +17,10 @@ from transformers import (
     BitsAndBytesConfig,
     TrainingArguments,
     Trainer,
-    DataCollatorForLanguageModeling,
     TrainerCallback,
 )
 from peft import LoraConfig, get_peft_model
+import torch.distributed as dist
 from torch.distributed import is_initialized, get_world_size
 
 
@@ -29,9 +33,9 @@ MODEL_NAME         = "google/gemma-3-1b-it"
 DATA_DIR           = "/group/sbms003/sji/datasets/clm_training_final/"
 #DATA_GLOB          = "**/f*.txt"
 DATA_GLOB          = "**/*.txt"
+TOKEN_CACHE_DIR    = os.path.join(DATA_DIR, ".tok_cache")  # Tokenized Arrow datasets, keyed by fingerprint
 
 SEQ_LEN            = 512
-OVERLAP_TOKENS     = 64
 BATCH_SIZE         = 1
 GRAD_ACCUM_STEPS   = 16
 LEARNING_RATE      = 2e-5
@@ -39,47 +43,113 @@ MAX_TOKENS         = 100_000_000  # Target number of tokens to train (global)
 OUTPUT_DIR         = "./gemma3-1b-it-lora-8bit-trainer"
 
 SEED               = 42
+TOKENIZE_BATCH     = 256          # Files per batched fast-tokenizer call
+NUM_PROC           = max(1, min(16, (os.cpu_count() or 1) // 2))  # Dataset build workers
+DDP_TIMEOUT        = 600                                            # Seconds, for training collectives
+DATASET_BUILD_TIMEOUT = timedelta(hours=6)                          # Ranks waiting on the first tokenization
+
+
+# =========================
+# Distributed setup
+#  - The process group is initialized here rather than by Trainer so that ranks
+#    can coordinate the dataset build; Trainer reuses an existing group.
+# =========================
+local_rank_str = os.environ.get("LOCAL_RANK", "0")
+try:
+    local_rank = int(local_rank_str)
+except ValueError:
+    local_rank = 0
+WORLD_SIZE = int(os.environ.get("WORLD_SIZE", "1"))
+
+if not torch.cuda.is_available():
+    raise RuntimeError(
+        "CUDA is not available in this process. "
+        "Ensure you allocated GPUs via SLURM and run torchrun inside that allocation."
+    )
+
+torch.cuda.set_device(local_rank)
+device_str = f"cuda:{local_rank}"
+
+if WORLD_SIZE > 1 and not is_initialized():
+    dist.init_process_group("nccl", timeout=timedelta(seconds=DDP_TIMEOUT))
 
 
 # =========================
 # Tokenizer
 # =========================
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, token=HF_TOKEN)
+tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, token=HF_TOKEN, use_fast=True)
 tokenizer.pad_token = tokenizer.eos_token
 
+# Narrowest Arrow dtype that holds every token id: uint16 halves dataset size
+# and DataLoader I/O for vocabs <= 65536 (Gemma3's 262k vocab stays int32).
+TOKEN_DTYPE = "uint16" if len(tokenizer) <= 65536 else "int32"
+
 
 # =========================
-# Document-level → Sliding chunks (Generator)
+# Document-level → Packed chunks (batched map)
 #  - Here, only writing to Arrow; shuffling is entirely handled by Trainer's Sampler.
 # =========================
-def iter_chunks(files: List[str], seq_len: int, overlap: int, add_eos: bool = True) -> Iterator[Dict[str, List[int]]]:
-    stride = seq_len - overlap
-    pad_id = tokenizer.pad_token_id
-    eos_tok = tokenizer.eos_token
-
-    for path in files:
+def _read_texts(paths: List[str]) -> List[str]:
+    texts = []
+    for path in paths:
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                text = f.read()
+            # Binary read + one decode: skips the text-mode newline translation layer
+            with open(path, "rb") as f:
+                texts.append(f.read().decode("utf-8"))
         except Exception as e:
             print(f"[WARN] skip file: {path} ({e})")
-            continue
+    return texts
 
-        if add_eos and eos_tok is not None:
-            text = text + eos_tok
 
-        ids = tokenizer.encode(text, add_special_tokens=False)
-        if not ids:
-            continue
+def _pack(buf: np.ndarray, seq_len: int):
+    """Split a packed token stream into full (n, seq_len) rows plus the leftover tail."""
+    n_full = len(buf) // seq_len
+    return buf[:n_full * seq_len].reshape(n_full, seq_len), buf[n_full * seq_len:]
 
-        for start in range(0, len(ids), stride):
-            chunk = ids[start:start + seq_len]
-            if not chunk:
-                break
-            if len(chunk) < seq_len:
-                chunk = chunk + [pad_id] * (seq_len - len(chunk))
-            attn = [1 if t != pad_id else 0 for t in chunk]
-            yield {"input_ids": chunk, "attention_mask": attn}
+
+def chunk_batch(batch: Dict[str, List[str]], seq_len: int, add_eos: bool = True) -> Dict[str, np.ndarray]:
+    """Batched `.map` callback: pack one batch of files into (n, seq_len) rows.
+
+    Documents are concatenated back-to-back (EOS-separated) and reshaped into
+    non-overlapping seq_len rows in one view, so each call hands Arrow a whole
+    record batch. Only the last row of each batch is padded. Documents are
+    separated only by EOS; positions run on across them (standard packing).
+    """
+    pad_id = tokenizer.pad_token_id
+    # EOS is appended as a token id after encoding rather than concatenated onto each text
+    eos = np.asarray([tokenizer.eos_token_id] if add_eos and tokenizer.eos_token_id is not None else [], dtype=TOKEN_DTYPE)
+
+    texts = _read_texts(batch["file"])
+    parts = [np.empty(0, dtype=TOKEN_DTYPE)]
+    if texts:
+        # One fast (Rust) tokenizer call for the whole batch of files
+        batch_ids = tokenizer(texts, add_special_tokens=False, return_attention_mask=False)["input_ids"]
+        for ids in batch_ids:
+            if ids:
+                parts.append(np.asarray(ids, dtype=TOKEN_DTYPE))
+                parts.append(eos)
+    buf = np.concatenate(parts)
+
+    rows, tail = _pack(buf, seq_len)
+    attn = np.ones(rows.shape, dtype=np.int8)
+    if len(tail):
+        last = np.full((1, seq_len), pad_id, dtype=TOKEN_DTYPE)
+        last[0, :len(tail)] = tail
+        last_attn = np.zeros((1, seq_len), dtype=np.int8)
+        last_attn[0, :len(tail)] = 1
+        rows = np.concatenate([rows, last])
+        attn = np.concatenate([attn, last_attn])
+    return {"input_ids": rows, "attention_mask": attn}
+
+
+def dataset_fingerprint(files: List[str]) -> str:
+    """Stable key over everything that changes the tokenized output."""
+    h = hashlib.sha1()
+    h.update(f"packed-batch{TOKENIZE_BATCH}|{MODEL_NAME}|{SEQ_LEN}|{len(tokenizer)}".encode())
+    for path in files:
+        st = os.stat(path)
+        h.update(f"|{path}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
 
 
 def build_dataset() -> Dataset:
@@ -87,53 +157,109 @@ def build_dataset() -> Dataset:
     if len(files) == 0:
         raise FileNotFoundError(f"No files match: {os.path.join(DATA_DIR, DATA_GLOB)}")
 
+    cache_dir = os.path.join(TOKEN_CACHE_DIR, dataset_fingerprint(files))
+    if os.path.isdir(cache_dir):
+        print(f"[INFO] Loading tokenized dataset from cache: {cache_dir}")
+        return Dataset.load_from_disk(cache_dir, keep_in_memory=False).with_format("numpy")
+
     features = Features({
-        "input_ids": Sequence(Value("int32")),
+        "input_ids": Sequence(Value(TOKEN_DTYPE)),
         "attention_mask": Sequence(Value("int8")),
     })
-    ds = Dataset.from_generator(
-        iter_chunks,
-        gen_kwargs={"files": files, "seq_len": SEQ_LEN, "overlap": OVERLAP_TOKENS, "add_eos": True},
-        features=features
+    ds = Dataset.from_dict({"file": files}).map(
+        chunk_batch,
+        fn_kwargs={"seq_len": SEQ_LEN, "add_eos": True},
+        batched=True,
+        batch_size=TOKENIZE_BATCH,
+        remove_columns=["file"],
+        features=features,
+        num_proc=NUM_PROC,  # `files` is sharded across workers; each tokenizes its own shard
+        keep_in_memory=False,
     )
+
+    # Write to a private dir then rename, so a concurrent rank never sees a partial cache.
+    tmp_dir = f"{cache_dir}.tmp{os.getpid()}"
+    ds.save_to_disk(tmp_dir)
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)  # Another rank finished first; its copy is identical.
+    ds = Dataset.load_from_disk(cache_dir, keep_in_memory=False).with_format("numpy")
     # Note: ds.shuffle() is NOT called here.
     # Shuffling and non-duplicated consumption are handled by Trainer's Sampler (DistributedSampler in DDP).
     return ds
 
 
-dataset = build_dataset()
+def build_dataset_local_main_first() -> Dataset:
+    """Tokenize on LOCAL_RANK 0 only; the other ranks wait, then load the cache it wrote."""
+    if WORLD_SIZE == 1:
+        return build_dataset()
+    # Separate CPU group: a cold build can far outlast the NCCL timeout used for training
+    build_group = dist.new_group(backend="gloo", timeout=DATASET_BUILD_TIMEOUT)
+    ds = build_dataset() if local_rank == 0 else None
+    dist.barrier(group=build_group)
+    return ds if ds is not None else build_dataset()
 
 
-# =========================
-# Data Collator
-# =========================
-collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+dataset = build_dataset_local_main_first()
 
 
 # =========================
-# Model (8bit + LoRA) - DDP safe batch
+# Data Collator (pre-packed rows → stacked narrow CPU tensors)
+#  - Rows stay int32/int8 on the host; DataLoader pin_memory pins them and
+#    ChunkTrainer._prepare_inputs does the async H2D copy + long cast on-device.
 # =========================
-bnb_config = BitsAndBytesConfig(load_in_8bit=True)
+@dataclass
+class PackedCollator:
+    def __call__(self, features: List[Dict[str, np.ndarray]]) -> Dict[str, torch.Tensor]:
+        input_ids = np.stack([f["input_ids"] for f in features]).astype(np.int32, copy=False)
+        attention_mask = np.stack([f["attention_mask"] for f in features])
+        return {
+            "input_ids": torch.from_numpy(input_ids),
+            "attention_mask": torch.from_numpy(attention_mask),
+        }
 
-local_rank_str = os.environ.get("LOCAL_RANK", "0")
-try:
-    local_rank = int(local_rank_str)
-except ValueError:
-    local_rank = 0
 
-if not torch.cuda.is_available():
-    raise RuntimeError(
-        "CUDA is not available in this process. "
-        "Ensure you allocated GPUs via SLURM and run torchrun inside that allocation."
-    )
+def finish_packed_batch(input_ids: torch.Tensor, attention_mask: torch.Tensor) -> Dict[str, torch.Tensor]:
+    """Build labels for packed rows (on whatever device the inputs live on).
+
+    - labels ignore only the trailing pad of the final row (EOS separators are trained on).
+    - position_ids are left to the model: with eager attention every token still sees the
+      earlier documents in its row, so restarting positions at EOS would not isolate them
+      and would only hand the model position/context combinations it never sees otherwise.
+    """
+    return {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        "labels": input_ids.masked_fill(attention_mask == 0, -100),
+    }
+
+
+collator = PackedCollator()
 
-torch.cuda.set_device(local_rank)
-device_str = f"cuda:{local_rank}"
+
+# =========================
+# Model (8bit/4bit + LoRA) - DDP safe batch
+# =========================
+# Ampere/Hopper (A100/H100): bf16 + TF32 + 4bit NF4 base (QLoRA-style).
+# Older GPUs (V100): fp16 + 8bit base, as before.
+# is_bf16_supported() also reports True on V100 via emulation, so gate on native support (SM 8.0+)
+USE_BF16 = torch.cuda.get_device_capability(local_rank)[0] >= 8
+if USE_BF16:
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    bnb_config = BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_compute_dtype=torch.bfloat16,
+    )
+else:
+    bnb_config = BitsAndBytesConfig(load_in_8bit=True)
 
 model = AutoModelForCausalLM.from_pretrained(
     MODEL_NAME,
     token=HF_TOKEN,
-    quantization_config=bnb_config,   # 8bit → CUDA required
+    quantization_config=bnb_config,   # 8bit/4bit → CUDA required
     device_map={"": device_str},      # Process=GPU 1:1 fixed
     low_cpu_mem_usage=True,
     attn_implementation="eager",      # Recommended for Gemma3
@@ -142,7 +268,7 @@ model = AutoModelForCausalLM.from_pretrained(
 lora_cfg = LoraConfig(
     r=8,
     lora_alpha=16,
-    target_modules=["q_proj", "v_proj"],
+    target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
     lora_dropout=0.1,
     bias="none",
     task_type="CAUSAL_LM",
@@ -171,6 +297,26 @@ class TokenStoppingCallback(TrainerCallback):
         return control
 
 
+# =========================
+# Trainer with DDP gradient_as_bucket_view + async input transfer
+#  - Grads alias the DDP all-reduce buckets, saving a grad<->bucket copy each step.
+#  - Pinned narrow batches are copied non_blocking and widened to long on the GPU.
+# =========================
+class ChunkTrainer(Trainer):
+    def _wrap_model(self, model, training=True, dataloader=None):
+        model = super()._wrap_model(model, training=training, dataloader=dataloader)
+        ddp_handler = getattr(self.accelerator, "ddp_handler", None)
+        if ddp_handler is not None:
+            ddp_handler.gradient_as_bucket_view = True
+        return model
+
+    def _prepare_inputs(self, inputs):
+        device = self.args.device
+        input_ids = inputs["input_ids"].to(device, non_blocking=True).long()
+        attention_mask = inputs["attention_mask"].to(device, non_blocking=True).long()
+        return finish_packed_batch(input_ids, attention_mask)
+
+
 # =========================
 # TrainingArguments + Trainer
 #   - Sampler handles shuffling/non-duplicated consumption/resume.
@@ -185,29 +331,36 @@ args = TrainingArguments(
     logging_steps=50,
     save_steps=1000,
     save_total_limit=2,
-    fp16=True,                      # V100: fp16
+    bf16=USE_BF16,                  # A100/H100: bf16 (no loss scaling)
+    fp16=not USE_BF16,              # V100: fp16
+    tf32=USE_BF16,                  # TF32 matmuls need Ampere+
+    gradient_checkpointing=True,
+    gradient_checkpointing_kwargs={"use_reentrant": False},
     report_to="none",
-    optim="adamw_torch",
+    optim="paged_adamw_8bit",       # bitsandbytes: 8bit optimizer state, fused kernels
+    lr_scheduler_type="cosine",
+    warmup_ratio=0.03,
     save_safetensors=True,
 
     # DataLoader tuning
     dataloader_num_workers=4,
     dataloader_pin_memory=True,
     dataloader_persistent_workers=True,
-    dataloader_prefetch_factor=2,
+    dataloader_prefetch_factor=2,   # Larger factors only cost host RAM here
     dataloader_drop_last=True,
 
     # Save Sampler/Scheduler/Optimizer state in the checkpoint
-    ddp_find_unused_parameters=True,
-    ddp_timeout=600,
+    ddp_find_unused_parameters=False,  # All LoRA adapters receive grads every step
+    ddp_bucket_cap_mb=50,
+    ddp_timeout=DDP_TIMEOUT,
 
     seed=SEED,
 )
 
-trainer = Trainer(
+trainer = ChunkTrainer(
     model=model,
     args=args,
-    train_dataset=dataset,           # Fixed-length Arrow Dataset
+    train_dataset=dataset,           # Fixed-length packed Arrow Dataset
     data_collator=collator,
     processing_class=tokenizer,      # (response to tokenizer deprecated warning)
     callbacks=[TokenStoppingCallback(MAX_TOKENS, SEQ_LEN, BATCH_SIZE)],
@@ -2,18 +2,58 @@ import sys
 import os
 import requests
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from urllib.parse import urljoin, urlparse
 
 # python3 download_pubmed.py https://ftp.ncbi.nlm.nih.gov/pubmed/baseline/    /group/cits5017/sji/cits5553/datasets/pubmed
 # python3 download_pubmed.py https://ftp.ncbi.nlm.nih.gov/pubmed/updatefiles/ /group/cits5017/sji/cits5553/datasets/pubmed
 
+MAX_CONNECTIONS = 16
+CHUNK_SIZE = 1 << 20  # 1 MiB
 
-def download_files_from_url(url, download_directory):
+
+def make_session(max_connections=MAX_CONNECTIONS):
+    """A keep-alive session whose connection pool matches the download concurrency."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def download_one(session, full_url, file_path):
+    """
+    Download full_url to file_path, resuming a partial file with an HTTP Range request.
+
+    Returns:
+        bool: True if the file is complete on disk.
+    """
+    offset = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+    with session.get(full_url, stream=True, headers=headers) as file_response:
+        if file_response.status_code == 416:
+            # Requested range starts at EOF: the file was already fully downloaded
+            return True
+        file_response.raise_for_status()
+
+        # 206 = server honoured the range; anything else restarts from scratch
+        mode = 'ab' if file_response.status_code == 206 else 'wb'
+        with open(file_path, mode) as f:
+            for chunk in file_response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+    return True
+
+
+def download_files_from_url(url, download_directory, max_connections=MAX_CONNECTIONS):
     if not os.path.exists(download_directory):
         os.makedirs(download_directory)
 
+    session = make_session(max_connections)
+
     try:
-        response = requests.get(url)
+        response = session.get(url)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         print(f"Error accessing the URL: {e}")
@@ -24,26 +64,25 @@ def download_files_from_url(url, download_directory):
     
     file_extensions = ['.gz']
 
-    downloaded_count = 0
+    targets = {}
     for link in all_links:
-        href = link['href']
-        full_url = urljoin(url, href)
-        
+        full_url = urljoin(url, link['href'])
         if any(full_url.lower().endswith(ext) for ext in file_extensions):
             file_name = os.path.basename(urlparse(full_url).path)
-            file_path = os.path.join(download_directory, file_name)
+            targets[full_url] = os.path.join(download_directory, file_name)
 
+    downloaded_count = 0
+    with ThreadPoolExecutor(max_workers=max_connections) as ex:
+        futures = {}
+        for full_url, file_path in targets.items():
             print(f"Downloading {full_url}...")
-            
+            futures[ex.submit(download_one, session, full_url, file_path)] = full_url
+
+        for future in as_completed(futures):
+            full_url = futures[future]
             try:
-                file_response = requests.get(full_url, stream=True)
-                file_response.raise_for_status()
-                
-                with open(file_path, 'wb') as f:
-                    for chunk in file_response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                
-                print(f"Successfully downloaded {file_name}")
+                future.result()
+                print(f"Successfully downloaded {os.path.basename(targets[full_url])}")
                 downloaded_count += 1
             except requests.exceptions.RequestException as e:
                 print(f"Failed to download {full_url}: {e}")
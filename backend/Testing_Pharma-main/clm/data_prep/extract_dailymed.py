@@ -1,7 +1,10 @@
 import sys
 import os
+import io
 import zipfile
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 '''
 dm_spl_release_human_rx_part5.zip
@@ -21,60 +24,75 @@ dm_spl_release_human_otc_part11.zip
         ./Neutrogena_1.jpg
 '''
 
-def process_nested_zip_for_xml(zip_path, output_dir):
+COPY_BUFSIZE = 1 << 20  # 1 MiB per read/write syscall
+
+_main_zip = None
+
+
+def _open_main_zip(zip_path):
+    """Worker initializer: open the main ZIP once per process, not once per member."""
+    global _main_zip
+    _main_zip = zipfile.ZipFile(zip_path, 'r')
+
+
+def _extract_nested_xml(nested_name, output_dir):
+    """
+    Reads one nested ZIP straight out of the main ZIP (in memory, never written
+    to disk) and saves its XML files to output_dir.
+    """
+    print(f"\nProcessing nested ZIP: {nested_name}")
+    try:
+        nested_bytes = io.BytesIO(_main_zip.read(nested_name))
+        with zipfile.ZipFile(nested_bytes, 'r') as nested_zip:
+            for member in nested_zip.namelist():
+                if member.lower().endswith('.xml'):
+                    # Create the full path for the XML file in the output directory
+                    xml_file_name = os.path.basename(member)
+                    output_path = os.path.join(output_dir, xml_file_name)
+                    
+                    print(f"  -> Extracting {xml_file_name} to {output_dir}")
+                    
+                    # Extract the XML file
+                    with nested_zip.open(member, 'r') as source_xml, open(output_path, 'wb') as dest_xml:
+                        shutil.copyfileobj(source_xml, dest_xml, COPY_BUFSIZE)
+                    print(f"  -> Successfully saved {xml_file_name}")
+
+    except zipfile.BadZipFile:
+        print(f"  - Error: The file {nested_name} is not a valid ZIP file. Skipping.")
+    except Exception as e:
+        print(f"  - An unexpected error occurred while processing {nested_name}: {e}")
+
+
+def process_nested_zip_for_xml(zip_path, output_dir, max_workers=None):
     """
     Processes a main ZIP file containing nested ZIPs, extracts only XML files,
     and saves them to a 'prescription' or 'otc' directory.
 
     Args:
         zip_path (str): The path to the main ZIP file.
+        output_dir (str): 'prescription' or 'otc'.
+        max_workers (int): Worker processes (defaults to os.cpu_count()).
     """
     print(f"Starting to process: {zip_path}")
 
     try:
-        # Step 1: Extract the contents of the main ZIP file to the temporary directory
+        # Step 1: List the nested ZIP files inside the main ZIP (no extraction to disk)
         with zipfile.ZipFile(zip_path, 'r') as main_zip:
-            print("Extracting main ZIP file...")
-            main_zip.extractall('.')
-            print("Main ZIP file extracted.")
-
-        # Step 2: Traverse the temporary directory to find nested ZIP files
-        for root, _, files in os.walk(output_dir):
-            for file_name in files:
-                if file_name.endswith('.zip'):
-                    nested_zip_path = os.path.join(root, file_name)
-                    print(f"\nProcessing nested ZIP: {nested_zip_path}")
-                    
-                    try:
-                        # Step 3: Extract only XML files from the nested ZIP
-                        with zipfile.ZipFile(nested_zip_path, 'r') as nested_zip:
-                            for member in nested_zip.namelist():
-                                if member.lower().endswith('.xml'):
-                                    # Create the full path for the XML file in the output directory
-                                    xml_file_name = os.path.basename(member)
-                                    output_path = os.path.join(output_dir, xml_file_name)
-                                    
-                                    print(f"  -> Extracting {xml_file_name} to {output_dir}")
-                                    
-                                    # Extract the XML file
-                                    with nested_zip.open(member, 'r') as source_xml, open(output_path, 'wb') as dest_xml:
-                                        shutil.copyfileobj(source_xml, dest_xml)
-                                    print(f"  -> Successfully saved {xml_file_name}")
-
-                    except zipfile.BadZipFile:
-                        print(f"  - Error: The file {nested_zip_path} is not a valid ZIP file. Skipping.")
-                    except Exception as e:
-                        print(f"  - An unexpected error occurred while processing {nested_zip_path}: {e}")
-                    finally:
-                        print(f"Deleting nested zip file: {nested_zip_path}")
-                        os.remove(nested_zip_path)
+            nested_names = [name for name in main_zip.namelist() if name.endswith('.zip')]
+
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Step 2: Extract XML files from each nested ZIP in parallel
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                 initializer=_open_main_zip, initargs=(zip_path,)) as ex:
+            list(ex.map(partial(_extract_nested_xml, output_dir=output_dir), nested_names, chunksize=16))
                         
     except zipfile.BadZipFile:
         print(f"Error: The file {zip_path} is not a valid ZIP file. Exiting.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
     finally:
-        # Step 4: Clean up the_main and nested zip_files
+        # Step 3: Clean up the main zip file
         print(f"Deleting original zip file: {zip_path}")
         os.remove(zip_path)
         #os.utime(zip_path, None)  # touch zip_path
@@ -1,35 +1,61 @@
 import sys
 import os
 import gzip
-import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from lxml import etree
 
 import pdb
 
 
-def get_full_text(element, namespaces):
+def get_full_text(element):
     """
-    Recursively extracts all text content from an XML element and its children,
+    Extracts all text content from an XML element and its children,
     adding spaces to maintain readability.
     """
     if element is None:
         return ""
     
-    parts = []
+    # itertext() walks the subtree in C; split/join collapses whitespace in one pass
+    return " ".join(" ".join(element.itertext()).split())
+
+def _process_one(filename, input_dir, output_dir):
+    """Extract section titles/texts of one SPL XML file into <output_dir>/<stem>.txt."""
+    file_path = os.path.join(input_dir, filename)
+    output_file = os.path.join(output_dir, f'{filename[:-4]}.txt')
     
-    # Text directly under the element
-    if element.text:
-        parts.append(element.text.strip())
+    try:
+        root = etree.parse(file_path).getroot()
+
+        # SPL documents use a default namespace (urn:hl7-org:v3); lxml's find()
+        # needs it bound to an explicit prefix.
+        ns = root.nsmap.get(None)
+        prefix = "v3:" if ns else ""
+        namespaces = {"v3": ns} if ns else None
         
-    # Iterate through all children to get their text and tail
-    for child in element:
-        parts.append(get_full_text(child, namespaces))
-        if child.tail:
-            parts.append(child.tail.strip())
+        lines = []
+        for section in root.iterfind(f'.//{prefix}section', namespaces):
+            title_text = get_full_text(section.find(f'./{prefix}title', namespaces))
+            text_text = get_full_text(section.find(f'./{prefix}text', namespaces))
             
-    # Join parts with a single space and clean up any extra spaces
-    return " ".join(parts).strip()
+            if title_text:
+                lines.append(title_text)
+            if text_text:
+                lines.append(text_text)
+
+        with open(output_file, 'w', encoding='utf-8') as outfile:
+            if lines:
+                outfile.write("\n".join(lines) + "\n")
+                                                
+        print(f"  -> Processed {filename} and saved to {output_file}")
+    
+    except etree.XMLSyntaxError as e:
+        print(f"  - Error parsing {filename}: {e}")
+    except Exception as e:
+        print(f"  - An unexpected error occurred with {filename}: {e}")
+
 
-def extract_dailymed_data(input_dir, output_dir):
+def extract_dailymed_data(input_dir, output_dir, max_workers=None):
     """
     Processes all XML files in a directory to extract and save
     section data to separate TXT files.
@@ -37,6 +63,7 @@ def extract_dailymed_data(input_dir, output_dir):
     Args:
         input_dir (str): The directory containing the XML files.
         output_dir (str): The directory to save the output TXT files.
+        max_workers (int): Worker processes (defaults to os.cpu_count()).
     """
     if not os.path.exists(input_dir):
         print(f"Error: The input directory '{input_dir}' does not exist.")
@@ -46,40 +73,11 @@ def extract_dailymed_data(input_dir, output_dir):
     
     print(f"Starting to process files in '{input_dir}'...")
 
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith('.xml'):
-            file_path = os.path.join(input_dir, filename)
-            
-            output_file = os.path.join(output_dir, f'{filename[:-4]}.txt')
-            
-            try:
-                tree = ET.parse(file_path)
-                root = tree.getroot()
-
-                namespaces = {
-                    prefix: uri for event, (prefix, uri) in ET.iterparse(file_path, events=['start-ns'])
-                }
-                
-                with open(output_file, 'w', encoding='utf-8') as outfile:
-                    for section in root.findall('.//section', namespaces):
-                        title_elem = section.find('./title', namespaces)
-                        text_elem = section.find('./text', namespaces)
-                        
-                        title_text = get_full_text(title_elem, namespaces)
-                        text_text = get_full_text(text_elem, namespaces)
-                        
-                        if title_text or text_text:
-                            if title_text:
-                                outfile.write(f"{title_text}\n")
-                            if text_text:
-                                outfile.write(f"{text_text}\n")
-                                                        
-                print(f"  -> Processed {filename} and saved to {output_file}")
-            
-            except ET.ParseError as e:
-                print(f"  - Error parsing {filename}: {e}")
-            except Exception as e:
-                print(f"  - An unexpected error occurred with {filename}: {e}")
+    filenames = [f for f in os.listdir(input_dir) if f.lower().endswith('.xml')]
+
+    # Labels are small and independent; chunksize amortizes the per-task IPC
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        list(ex.map(partial(_process_one, input_dir=input_dir, output_dir=output_dir), filenames, chunksize=8))
 
     print(f"\nCompleted. All extracted data saved to '{output_dir}'")
 
@@ -1,7 +1,9 @@
 import sys
 import os
 import gzip
-import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from lxml import etree
 
 '''
 #import re
@@ -17,80 +19,77 @@ def get_full_text_from_element(element):
     Extracts all text content from an XML element, including nested child text.
     
     Args:
-        element: An xml.etree.ElementTree element.
+        element: An lxml element.
     
     Returns:
-        str: The full concatenated text.
+        str: The full concatenated text, whitespace-normalized.
     """
-    text_content = ""
-    # Get the text directly from the parent element
-    if element.text:
-        text_content += element.text.strip()
-   
-    # Iterate through all children to get their text and tail
-    for child in element.iter():
-        if child.text:
-            text_content += " " + child.text.strip()
-        if child.tail:
-            text_content += " " + child.tail.strip()
-            
-    # Clean up any multiple spaces that might have been created
-    return " ".join(text_content.split())
-
-
-def extract_pubmed_articles_to_txt(input_dir, output_dir):
-    for filename in os.listdir(input_dir):
-        if not filename.lower().endswith('.xml.gz'):
-            continue
-
-        output_sub_dir = os.path.join(output_dir, filename[:-7])
-        #os.makedirs(output_sub_dir, exist_ok=True)
-        try:
-            os.makedirs(output_sub_dir, exist_ok=False)
-        except FileExistsError as e:
-            print(f'  -> Skipping {filename}')
-            continue
-
-        file_path = os.path.join(input_dir, filename)
-        print(f"  -> Processing {filename}")
-
-        try:
-            with gzip.open(file_path, 'r') as xml_file:
-                tree = ET.parse(xml_file)
-                root = tree.getroot()
-
-                for article in root.findall('.//PubmedArticle'):
-                    pmid_element = article.find('.//PMID')
-                    title_element = article.find('.//ArticleTitle')
-                    abstract_element = article.find('.//Abstract') # Find the parent of AbstractText
-
-                    pmid_text = ""
-                    if pmid_element is not None:
-                        pmid_text = pmid_element.text.strip()
-                    
-                    # Use the new function to get all text from the elements
-                    title_text = ""
-                    if title_element is not None:
-                        title_text = get_full_text_from_element(title_element)
-                    
-                    abstract_text = ""
-                    # AbstractText can be nested within Abstract, so we use findall
-                    if abstract_element is not None:
-                        abstract_text_list = abstract_element.findall('.//AbstractText')
-                        for abs_text in abstract_text_list:
-                            abstract_text += get_full_text_from_element(abs_text) + " "
-
-                    if len(pmid_text) * len(title_text) * len(abstract_text) != 0:
-                        output_file = os.path.join(output_sub_dir, f'{pmid_text}.txt')
-                        with open(output_file, 'w', encoding='utf-8') as outfile:
-                            outfile.write(f"{title_text}\n")
-                            outfile.write(f"{abstract_text.strip()}\n")
-                        print(f"Extracted data saved to '{output_file}'")
-        
-        except ET.ParseError as e:
-            print(f"  - Error parsing {filename}: {e}")
-        except Exception as e:
-            print(f"  - An unexpected error occurred with {filename}: {e}")
+    # itertext() walks the subtree in C; split/join collapses whitespace in one pass
+    return " ".join(" ".join(element.itertext()).split())
+
+
+def _process_one(filename, input_dir, output_dir):
+    """Extract every article of one .xml.gz file into <output_dir>/<file stem>/<PMID>.txt."""
+    output_sub_dir = os.path.join(output_dir, filename[:-7])
+    #os.makedirs(output_sub_dir, exist_ok=True)
+    try:
+        os.makedirs(output_sub_dir, exist_ok=False)
+    except FileExistsError as e:
+        print(f'  -> Skipping {filename}')
+        return
+
+    file_path = os.path.join(input_dir, filename)
+    print(f"  -> Processing {filename}")
+
+    try:
+        with gzip.open(file_path, 'rb') as xml_file:
+            # Stream one <PubmedArticle> at a time instead of building the whole tree
+            for _, article in etree.iterparse(xml_file, events=("end",), tag="PubmedArticle"):
+                pmid_element = article.find('.//PMID')
+                title_element = article.find('.//ArticleTitle')
+                abstract_element = article.find('.//Abstract') # Find the parent of AbstractText
+
+                pmid_text = ""
+                if pmid_element is not None:
+                    pmid_text = pmid_element.text.strip()
+                
+                # Use the new function to get all text from the elements
+                title_text = ""
+                if title_element is not None:
+                    title_text = get_full_text_from_element(title_element)
+                
+                abstract_text = ""
+                # AbstractText can be nested within Abstract, so we use findall
+                if abstract_element is not None:
+                    abstract_text_list = abstract_element.findall('.//AbstractText')
+                    for abs_text in abstract_text_list:
+                        abstract_text += get_full_text_from_element(abs_text) + " "
+
+                if len(pmid_text) * len(title_text) * len(abstract_text) != 0:
+                    output_file = os.path.join(output_sub_dir, f'{pmid_text}.txt')
+                    with open(output_file, 'w', encoding='utf-8') as outfile:
+                        outfile.write(f"{title_text}\n")
+                        outfile.write(f"{abstract_text.strip()}\n")
+                    print(f"Extracted data saved to '{output_file}'")
+
+                # Release the processed article and its already-visited siblings
+                article.clear()
+                while article.getprevious() is not None:
+                    del article.getparent()[0]
+    
+    except etree.XMLSyntaxError as e:
+        print(f"  - Error parsing {filename}: {e}")
+    except Exception as e:
+        print(f"  - An unexpected error occurred with {filename}: {e}")
+
+
+def extract_pubmed_articles_to_txt(input_dir, output_dir, max_workers=None):
+    filenames = [f for f in os.listdir(input_dir) if f.lower().endswith('.xml.gz')]
+
+    # Each file is independent gzip+XML work writing to its own sub directory.
+    # Baseline files take seconds each, so hand them out one at a time to keep workers balanced.
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        list(ex.map(partial(_process_one, input_dir=input_dir, output_dir=output_dir), filenames, chunksize=1))
     
     print(f"\nCompleted.")
 
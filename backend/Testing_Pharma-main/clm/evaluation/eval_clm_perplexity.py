@@ -3,6 +3,7 @@ import glob
 import math
 import random
 import torch
+import torch.nn.functional as F
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
 # --------------------------
@@ -12,8 +13,20 @@ DATA_DIR = "/group/sbms003/sji/datasets/clm_training_final/"
 LOCAL_MODEL_PATH = "./gemma3-1b-it-lora-8bit-trainer/checkpoint-59000"
 BASE_MODEL_NAME = "google/gemma-3-1b-it"  # from Hugging Face Hub
 N_SAMPLES = 100   # the number of validation sample files
+BATCH_SIZE = 8    # sequences per forward pass; Gemma3's 262k vocab makes each row's logits ~270 MB in bf16
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
+# Native bf16 needs SM 8.0+; is_bf16_supported() also says True for emulated bf16 on V100
+dtype = torch.bfloat16 if device == "cuda" and torch.cuda.get_device_capability()[0] >= 8 else torch.float32
+
+def load_model(model_path):
+    # Fused SDPA attention + compiled forward; eval shapes are (nearly) static
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path, attn_implementation="sdpa", torch_dtype=dtype
+    ).to(device)
+    if device == "cuda":
+        model = torch.compile(model, mode="reduce-overhead", fullgraph=False)
+    return model
 
 # --------------------------
 # Collect validation files
@@ -28,17 +41,38 @@ random.shuffle(files)
 sample_files = random.sample(files, min(N_SAMPLES, len(files)))  
 print(f"Using {N_SAMPLES} sample files for evaluation.")
 
-def compute_perplexity(model, tokenizer, files, label, max_length=512):
-    losses = []
+sample_texts = []
+for f in sample_files:
+    with open(f) as fh:
+        sample_texts.append(fh.read())
+
+def compute_perplexity(model, tokenizer, texts, label, max_length=512, batch_size=BATCH_SIZE):
+    """Corpus perplexity exp(total NLL / total tokens), padding excluded."""
     model.eval()
-    for f in files:
-        text = open(f).read()
-        enc = tokenizer(text, return_tensors="pt", truncation=True, max_length=max_length).to(device)
+    tokenizer.padding_side = "right"
+    enc = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=max_length)
+
+    nll_sum = 0.0
+    token_count = 0
+    for i in range(0, len(texts), batch_size):
+        input_ids = enc.input_ids[i:i + batch_size].to(device)
+        attention_mask = enc.attention_mask[i:i + batch_size].to(device)
         with torch.no_grad():
-            labels = enc.input_ids.clone()
-            outputs = model(**enc, labels=labels)
-            losses.append(outputs.loss.item())
-    ppl = math.exp(sum(losses) / len(losses))
+            logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+        shift_labels = input_ids[:, 1:].masked_fill(attention_mask[:, 1:] == 0, -100)
+        # Upcast one row at a time: the whole batch in fp32 would be several GB
+        for row_logits, row_labels in zip(logits[:, :-1], shift_labels):
+            nll_sum += F.cross_entropy(
+                row_logits.float(),
+                row_labels,
+                reduction="sum",
+                ignore_index=-100,
+            ).item()
+        token_count += int((shift_labels != -100).sum())
+        del logits
+
+    ppl = math.exp(nll_sum / token_count)
     print(f"{label} Validation Perplexity: {ppl:.2f}")
     return ppl
 
@@ -47,15 +81,15 @@ def compute_perplexity(model, tokenizer, files, label, max_length=512):
 # --------------------------
 print("\n[1] Evaluating local CLM-trained checkpoint...")
 ft_tokenizer = AutoTokenizer.from_pretrained(LOCAL_MODEL_PATH)
-ft_model = AutoModelForCausalLM.from_pretrained(LOCAL_MODEL_PATH).to(device)
+ft_model = load_model(LOCAL_MODEL_PATH)
 
-compute_perplexity(ft_model, ft_tokenizer, sample_files, "CLM-trained")
+compute_perplexity(ft_model, ft_tokenizer, sample_texts, "CLM-trained")
 
 # --------------------------
 # 2. Hugging Face Base Model
 # --------------------------
 print("\n[2] Evaluating base model from Hugging Face...")
 base_tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME)
-base_model = AutoModelForCausalLM.from_pretrained(BASE_MODEL_NAME).to(device)
+base_model = load_model(BASE_MODEL_NAME)
 
-compute_perplexity(base_model, base_tokenizer, sample_files, "Base")
+compute_perplexity(base_model, base_tokenizer, sample_texts, "Base")
@@ -9,11 +9,15 @@ LOCAL_MODEL_PATH = "./gemma3-1b-it-lora-8bit-trainer/checkpoint-59000"
 BASE_MODEL_NAME = "google/gemma-3-1b-it" # from Hugging Face Hub
 MAX_NEW_TOKENS = 256
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Native bf16 needs SM 8.0+; is_bf16_supported() also says True for emulated bf16 on V100
+DTYPE = torch.bfloat16 if DEVICE == "cuda" and torch.cuda.get_device_capability()[0] >= 8 else torch.float32
 
 def load_model_and_tokenizer(model_path, label):
     print(f"[INFO] Loading {label}...")
     tokenizer = AutoTokenizer.from_pretrained(model_path)
-    model = AutoModelForCausalLM.from_pretrained(model_path).to(DEVICE)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path, attn_implementation="sdpa", torch_dtype=DTYPE
+    ).to(DEVICE)
     return tokenizer, model
 
 def generate_response(model, tokenizer, prompt):
@@ -2,18 +2,18 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import Optional, List
 from app.core.database import get_db
-from app.services.external_apis import ExternalAPIService
+from app.services.external_apis import ExternalAPIService, get_external_api_service
 
 router = APIRouter()
 
 @router.get("/test-integrations")
-async def test_external_integrations():
+async def test_external_integrations(
+    api_service: ExternalAPIService = Depends(get_external_api_service)
+):
     """
     Test all external API integrations
     """
     try:
-        api_service = ExternalAPIService()
-        
         # Test each API individually
         results = {}
         
@@ -73,8 +73,6 @@ async def test_external_integrations():
         except Exception as e:
             results["fda"] = {"status": "error", "error": str(e)}
         
-        await api_service.close()
-        
         return {
             "message": "External API integration test completed",
             "results": results,
@@ -89,22 +87,19 @@ async def comprehensive_search(
     query: str = Query(..., description="Search query"),
     therapeutic_area: Optional[str] = Query(None, description="Therapeutic area filter"),
     drug_name: Optional[str] = Query(None, description="Drug name filter"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    api_service: ExternalAPIService = Depends(get_external_api_service)
 ):
     """
     Perform comprehensive search across all external APIs
     """
     try:
-        api_service = ExternalAPIService()
-        
         comprehensive_data = await api_service.search_comprehensive_research(
             query=query,
             therapeutic_area=therapeutic_area,
             drug_name=drug_name
         )
         
-        await api_service.close()
-        
         return comprehensive_data
         
     except Exception as e:
@@ -114,21 +109,18 @@ async def comprehensive_search(
 async def get_market_intelligence(
     therapeutic_area: str = Query(..., description="Therapeutic area"),
     drug_name: Optional[str] = Query(None, description="Drug name"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    api_service: ExternalAPIService = Depends(get_external_api_service)
 ):
     """
     Get market intelligence for a specific therapeutic area
     """
     try:
-        api_service = ExternalAPIService()
-        
         market_data = await api_service.get_market_intelligence(
             therapeutic_area=therapeutic_area,
             drug_name=drug_name
         )
         
-        await api_service.close()
-        
         return market_data
         
     except Exception as e:
@@ -138,21 +130,18 @@ async def get_market_intelligence(
 async def get_competitive_landscape(
     therapeutic_area: str = Query(..., description="Therapeutic area"),
     drug_name: Optional[str] = Query(None, description="Drug name"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    api_service: ExternalAPIService = Depends(get_external_api_service)
 ):
     """
     Get competitive landscape analysis
     """
     try:
-        api_service = ExternalAPIService()
-        
         competitive_data = await api_service.get_competitive_landscape(
             therapeutic_area=therapeutic_area,
             drug_name=drug_name
         )
         
-        await api_service.close()
-        
         return competitive_data
         
     except Exception as e:
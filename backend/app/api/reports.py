@@ -1,18 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.responses import iter_json_array, make_etag, etag_matches
 from app.models.models import Report
 from app.services.report_generators import ReportService
 import os
-import uuid
+import secrets
+import shutil
+import sys
 from datetime import datetime
 
 router = APIRouter()
 report_service = ReportService()
 
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB copy buffer for uploads still held in memory
+UPLOAD_SPOOL_MAX_SIZE = 1024 * 1024  # Starlette keeps multipart files up to this size in memory
+# os.sendfile only accepts a regular file as the destination on Linux (macOS needs a socket)
+SENDFILE_TO_FILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+
+def _save_upload(src, dest_path: str) -> int:
+    """
+    Copy an upload's spooled file to dest_path and return the byte count. On Linux, uploads
+    large enough to have been spooled to disk are copied kernel-side with os.sendfile;
+    everything else (sendfile into a regular file is Linux-only) is a buffered copy.
+    """
+    size = src.seek(0, os.SEEK_END)
+    src.seek(0)
+    with open(dest_path, "wb") as dst:
+        # Past the spool threshold the data is already on disk, so fileno() won't force a rollover
+        if SENDFILE_TO_FILE and size > UPLOAD_SPOOL_MAX_SIZE:
+            src.flush()
+            in_fd, out_fd = src.fileno(), dst.fileno()
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return offset
+        shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+        return dst.tell()
+
 class ReportRequest(BaseModel):
     title: str
     report_type: str  # pdf, excel, both
@@ -25,77 +59,86 @@ class ReportResponse(BaseModel):
     title: str
     report_type: str
     file_path: Optional[str]
-    metadata: dict
-    created_at: str
+    # The ORM attribute is report_metadata (declarative reserves `metadata`); the API key stays "metadata"
+    metadata: dict = Field(alias="report_metadata")
+    created_at: datetime
 
-@router.post("/generate", response_model=ReportResponse)
+    class Config:
+        orm_mode = True
+        frozen = True
+        allow_population_by_field_name = True
+
+@router.post("/generate", response_model=ReportResponse, response_model_by_alias=False)
 async def generate_report(
     report_request: ReportRequest,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """
     Generate a new report using the report service
     """
-    try:
-        # Prepare research data
-        research_data = report_request.research_data or {
-            "query": report_request.title,
-            "therapeutic_area": "Women's Oncology",
-            "market_size": 15000,
-            "growth_rate": 9.5,
-            "clinical_trials": {"trials": []},
-            "patents": {"patents": []},
-            "literature": {"articles": []},
-            "fda_data": {"drugs": []}
+    # Prepare research data
+    research_data = report_request.research_data or {
+        "query": report_request.title,
+        "therapeutic_area": "Women's Oncology",
+        "market_size": 15000,
+        "growth_rate": 9.5,
+        "clinical_trials": {"trials": []},
+        "patents": {"patents": []},
+        "literature": {"articles": []},
+        "fda_data": {"drugs": []}
+    }
+    
+    # Generate report using the report service
+    report_result = await report_service.generate_comprehensive_report(
+        research_data=research_data,
+        report_type=report_request.report_type,
+        filename_prefix=report_request.title.replace(" ", "_"),
+        executor=request.app.state.cpu_pool
+    )
+    
+    if "error" in report_result:
+        raise HTTPException(status_code=500, detail=report_result["error"])
+    
+    # Create report record for the first generated file
+    first_file = report_result["files"][0] if report_result["files"] else None
+    if first_file:
+        report_metadata = {
+            "template": report_request.template,
+            "generated_at": report_result["generated_at"],
+            "status": "completed",
+            "all_files": report_result["files"],
+            "report_metadata": report_result["metadata"]
         }
-        
-        # Generate report using the report service
-        report_result = await report_service.generate_comprehensive_report(
-            research_data=research_data,
-            report_type=report_request.report_type,
-            filename_prefix=report_request.title.replace(" ", "_")
-        )
-        
-        if "error" in report_result:
-            raise HTTPException(status_code=500, detail=report_result["error"])
-        
-        # Create report record for the first generated file
-        first_file = report_result["files"][0] if report_result["files"] else None
-        if first_file:
-            report = Report(
+        # Single INSERT ... RETURNING for the server-generated columns; no refresh SELECT
+        row = db.execute(
+            insert(Report)
+            .values(
                 user_id=1,  # Default user for now
                 session_id=report_request.session_id,
                 title=report_request.title,
                 report_type=first_file["type"],
                 file_path=first_file["path"],
-                metadata={
-                    "template": report_request.template,
-                    "generated_at": report_result["generated_at"],
-                    "status": "completed",
-                    "all_files": report_result["files"],
-                    "report_metadata": report_result["metadata"]
-                }
+                report_metadata=report_metadata
             )
-            db.add(report)
-            db.commit()
-            db.refresh(report)
-            
-            return ReportResponse(
-                id=report.id,
-                title=report.title,
-                report_type=report.report_type,
-                file_path=report.file_path,
-                metadata=report.report_metadata,
-                created_at=report.created_at.isoformat()
-            )
-        else:
-            raise HTTPException(status_code=500, detail="No files generated")
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            .returning(Report.id, Report.created_at)
+        ).one()
+        db.commit()
+        
+        return ReportResponse(
+            id=row.id,
+            title=report_request.title,
+            report_type=first_file["type"],
+            file_path=first_file["path"],
+            metadata=report_metadata,
+            created_at=row.created_at
+        )
+    else:
+        raise HTTPException(status_code=500, detail="No files generated")
 
-@router.get("/", response_model=List[ReportResponse])
+@router.get("/", response_model=List[ReportResponse], response_model_by_alias=False)
 async def get_reports(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
@@ -103,24 +146,30 @@ async def get_reports(
     """
     Get all reports
     """
-    try:
-        reports = db.query(Report).offset(skip).limit(limit).all()
-        
-        return [
-            ReportResponse(
-                id=report.id,
-                title=report.title,
-                report_type=report.report_type,
-                file_path=report.file_path,
-                metadata=report.report_metadata,
-                created_at=report.created_at.isoformat()
-            )
-            for report in reports
-        ]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Reports are insert-only, so the primary-key max versions the whole list
+    version = db.execute(select(func.max(Report.id))).one()
+    etag = make_etag("reports", skip, limit, *version)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # Plain column rows (no ORM hydration), fetched in batches of 200 and encoded as they arrive
+    stmt = (
+        select(
+            Report.id,
+            Report.title,
+            Report.report_type,
+            Report.file_path,
+            Report.report_metadata.label("metadata"),
+            Report.created_at
+        )
+        .offset(skip)
+        .limit(limit)
+        .execution_options(yield_per=200)
+    )
+    rows = (dict(row._mapping) for row in db.execute(stmt))
+    return StreamingResponse(iter_json_array(rows), media_type="application/json", headers={"ETag": etag})
 
-@router.get("/{report_id}", response_model=ReportResponse)
+@router.get("/{report_id}", response_model=ReportResponse, response_model_by_alias=False)
 async def get_report(
     report_id: int,
     db: Session = Depends(get_db)
@@ -128,23 +177,11 @@ async def get_report(
     """
     Get a specific report
     """
-    try:
-        report = db.query(Report).filter(Report.id == report_id).first()
-        if not report:
-            raise HTTPException(status_code=404, detail="Report not found")
-        
-        return ReportResponse(
-            id=report.id,
-            title=report.title,
-            report_type=report.report_type,
-            file_path=report.file_path,
-            metadata=report.report_metadata,
-            created_at=report.created_at.isoformat()
-        )
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    report = db.query(Report).filter(Report.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    return ReportResponse.from_orm(report)
 
 @router.get("/download/{report_id}")
 async def download_report(
@@ -154,35 +191,36 @@ async def download_report(
     """
     Download a report file
     """
-    try:
-        report = db.query(Report).filter(Report.id == report_id).first()
-        if not report:
-            raise HTTPException(status_code=404, detail="Report not found")
+    report = db.query(Report).filter(Report.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
 
-        if not report.file_path or not os.path.exists(report.file_path):
-            raise HTTPException(status_code=404, detail="Report file not found")
+    # One stat() serves both the existence check and FileResponse's headers
+    try:
+        file_stat = os.stat(report.file_path) if report.file_path else None
+    except OSError:
+        file_stat = None
+    if file_stat is None:
+        raise HTTPException(status_code=404, detail="Report file not found")
 
-        # Determine media type based on file extension
-        file_extension = os.path.splitext(report.file_path)[1].lower()
-        if file_extension == '.pdf':
-            media_type = "application/pdf"
-        elif file_extension in ['.xlsx', '.xls']:
-            media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        else:
-            media_type = "application/octet-stream"
+    # Determine media type based on file extension
+    file_extension = os.path.splitext(report.file_path)[1].lower()
+    if file_extension == '.pdf':
+        media_type = "application/pdf"
+    elif file_extension in ['.xlsx', '.xls']:
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        media_type = "application/octet-stream"
 
-        # Use report title as filename, replace spaces with underscores and add extension
-        filename = f"{report.title.replace(' ', '_')}{file_extension}"
+    # Use report title as filename, replace spaces with underscores and add extension
+    filename = f"{report.title.replace(' ', '_')}{file_extension}"
 
-        return FileResponse(
-            path=report.file_path,
-            media_type=media_type,
-            filename=filename
-        )
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(
+        path=report.file_path,
+        media_type=media_type,
+        filename=filename,
+        stat_result=file_stat
+    )
 
 @router.post("/upload")
 async def upload_document(
@@ -192,25 +230,23 @@ async def upload_document(
     """
     Upload a document for analysis
     """
-    try:
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'txt'
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = f"uploads/{unique_filename}"
-        
-        # Create uploads directory if it doesn't exist
-        os.makedirs("uploads", exist_ok=True)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        return {
-            "filename": file.filename,
-            "file_path": file_path,
-            "file_size": len(content),
-            "uploaded_at": datetime.now().isoformat()
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Generate unique filename
+    file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'txt'
+    unique_filename = f"{secrets.token_hex(16)}.{file_extension}"
+    file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
+    
+    # The multipart parser already spooled the body; reject oversize uploads before copying it
+    if file.size is not None and file.size > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File too large")
+    
+    total = await run_in_threadpool(_save_upload, file.file, file_path)
+    if total > settings.MAX_FILE_SIZE:
+        os.remove(file_path)
+        raise HTTPException(status_code=413, detail="File too large")
+    
+    return {
+        "filename": file.filename,
+        "file_path": file_path,
+        "file_size": total,
+        "uploaded_at": datetime.now()
+    }
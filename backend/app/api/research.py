@@ -1,13 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import asyncio
+from datetime import datetime
 from pydantic import BaseModel
-from app.core.database import get_db
+from app.core.database import get_db, SessionLocal
+from app.core.responses import iter_json_array, make_etag, etag_matches
 from app.models.models import User, ResearchSession, ChatMessage, AgentResult
-from app.services.master_agent import MasterAgent
+from app.services.master_agent import MasterAgent, get_master_agent
 
 router = APIRouter()
-master_agent = MasterAgent()
+
+def _messages_stmt(session_id: int):
+    return select(
+        ChatMessage.id,
+        ChatMessage.role,
+        ChatMessage.content,
+        ChatMessage.message_metadata.label("metadata"),
+        ChatMessage.created_at
+    ).where(ChatMessage.session_id == session_id)
+
+def _agent_results_stmt(session_id: int):
+    return select(
+        AgentResult.id,
+        AgentResult.agent_type,
+        AgentResult.query,
+        AgentResult.result_data,
+        AgentResult.status,
+        AgentResult.error_message,
+        AgentResult.created_at
+    ).where(AgentResult.session_id == session_id)
+
+def _fetch_rows(stmt) -> List[dict]:
+    """Run one read-only statement on its own Session, so several can run on parallel threads."""
+    with SessionLocal() as db:
+        return [dict(row._mapping) for row in db.execute(stmt)]
 
 class ChatRequest(BaseModel):
     message: str
@@ -30,33 +60,35 @@ class SessionResponse(BaseModel):
     description: Optional[str]
     query: str
     status: str
-    created_at: str
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+        frozen = True
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(
     request: ChatRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    master_agent: MasterAgent = Depends(get_master_agent)
 ):
     """
     Main chat endpoint for interacting with the Master Agent
     """
-    try:
-        result = await master_agent.process_query(
-            query=request.message,
-            db=db,
-            background_tasks=background_tasks,
-            session_id=request.session_id
-        )
-        
-        return ChatResponse(
-            response=result["response"],
-            session_id=result["session_id"],
-            agent_results=result.get("agent_results", {}),
-            metadata=result.get("metadata", {})
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    result = await master_agent.process_query(
+        query=request.message,
+        db=db,
+        background_tasks=background_tasks,
+        session_id=request.session_id
+    )
+    
+    return ChatResponse(
+        response=result["response"],
+        session_id=result["session_id"],
+        agent_results=result.get("agent_results", {}),
+        metadata=result.get("metadata", {})
+    )
 
 @router.post("/sessions", response_model=SessionResponse)
 async def create_session(
@@ -66,30 +98,31 @@ async def create_session(
     """
     Create a new research session
     """
-    try:
-        session = ResearchSession(
+    # Single INSERT ... RETURNING for the server-generated columns; no refresh SELECT
+    row = db.execute(
+        insert(ResearchSession)
+        .values(
             title=session_data.title,
             description=session_data.description,
             query=session_data.query,
             user_id=1  # Default user for now
         )
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        
-        return SessionResponse(
-            id=session.id,
-            title=session.title,
-            description=session.description,
-            query=session.query,
-            status=session.status,
-            created_at=session.created_at.isoformat()
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        .returning(ResearchSession.id, ResearchSession.status, ResearchSession.created_at)
+    ).one()
+    db.commit()
+    
+    return SessionResponse(
+        id=row.id,
+        title=session_data.title,
+        description=session_data.description,
+        query=session_data.query,
+        status=row.status,
+        created_at=row.created_at
+    )
 
 @router.get("/sessions", response_model=List[SessionResponse])
 async def get_sessions(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
@@ -97,22 +130,30 @@ async def get_sessions(
     """
     Get all research sessions
     """
-    try:
-        sessions = db.query(ResearchSession).offset(skip).limit(limit).all()
-        
-        return [
-            SessionResponse(
-                id=session.id,
-                title=session.title,
-                description=session.description,
-                query=session.query,
-                status=session.status,
-                created_at=session.created_at.isoformat()
-            )
-            for session in sessions
-        ]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # New rows bump max(id), edits bump max(updated_at); both are index lookups
+    version = db.execute(
+        select(func.max(ResearchSession.id), func.max(ResearchSession.updated_at))
+    ).one()
+    etag = make_etag("research_sessions", skip, limit, *version)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # Plain column rows (no ORM hydration), fetched in batches of 200 and encoded as they arrive
+    stmt = (
+        select(
+            ResearchSession.id,
+            ResearchSession.title,
+            ResearchSession.description,
+            ResearchSession.query,
+            ResearchSession.status,
+            ResearchSession.created_at
+        )
+        .offset(skip)
+        .limit(limit)
+        .execution_options(yield_per=200)
+    )
+    rows = (dict(row._mapping) for row in db.execute(stmt))
+    return StreamingResponse(iter_json_array(rows), media_type="application/json", headers={"ETag": etag})
 
 @router.get("/sessions/{session_id}", response_model=SessionResponse)
 async def get_session(
@@ -122,53 +163,39 @@ async def get_session(
     """
     Get a specific research session
     """
-    try:
-        session = db.query(ResearchSession).filter(ResearchSession.id == session_id).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        return SessionResponse(
-            id=session.id,
-            title=session.title,
-            description=session.description,
-            query=session.query,
-            status=session.status,
-            created_at=session.created_at.isoformat()
-        )
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    session = db.query(ResearchSession).filter(ResearchSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return SessionResponse.from_orm(session)
 
 @router.get("/sessions/{session_id}/messages")
 async def get_session_messages(
     session_id: int,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """
     Get all messages for a specific session
     """
-    try:
-        session = db.query(ResearchSession).filter(ResearchSession.id == session_id).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        messages = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).all()
-        
-        return [
-            {
-                "id": message.id,
-                "role": message.role,
-                "content": message.content,
-                "metadata": message.message_metadata,
-                "created_at": message.created_at.isoformat()
-            }
-            for message in messages
-        ]
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Messages are append-only, so the latest id among the session's rows (found through
+    # ix_msg_session_created) versions the list. No row means the session doesn't exist.
+    version = db.execute(
+        select(func.max(ChatMessage.id))
+        .select_from(ResearchSession)
+        .outerjoin(ChatMessage, ChatMessage.session_id == ResearchSession.id)
+        .where(ResearchSession.id == session_id)
+        .group_by(ResearchSession.id)
+    ).one_or_none()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    etag = make_etag("chat_messages", session_id, *version)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    rows = db.execute(_messages_stmt(session_id)).all()
+    
+    return ORJSONResponse([dict(row._mapping) for row in rows], headers={"ETag": etag})
 
 @router.get("/sessions/{session_id}/agent-results")
 async def get_session_agent_results(
@@ -178,26 +205,45 @@ async def get_session_agent_results(
     """
     Get all agent results for a specific session
     """
-    try:
-        session = db.query(ResearchSession).filter(ResearchSession.id == session_id).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        agent_results = db.query(AgentResult).filter(AgentResult.session_id == session_id).all()
-        
-        return [
-            {
-                "id": result.id,
-                "agent_type": result.agent_type,
-                "query": result.query,
-                "result_data": result.result_data,
-                "status": result.status,
-                "error_message": result.error_message,
-                "created_at": result.created_at.isoformat()
-            }
-            for result in agent_results
-        ]
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    stmt = (
+        select(
+            AgentResult.id,
+            AgentResult.agent_type,
+            AgentResult.query,
+            AgentResult.result_data,
+            AgentResult.status,
+            AgentResult.error_message,
+            AgentResult.created_at
+        )
+        .select_from(ResearchSession)
+        .outerjoin(AgentResult, AgentResult.session_id == ResearchSession.id)
+        .where(ResearchSession.id == session_id)
+    )
+    rows = db.execute(stmt).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return [dict(row._mapping) for row in rows if row.id is not None]
+
+@router.get("/sessions/{session_id}/full")
+async def get_session_full(session_id: int):
+    """
+    Get a session together with its messages and agent results
+    """
+    # The three reads are independent, so they run concurrently on separate connections
+    session_rows, messages, agent_results = await asyncio.gather(
+        run_in_threadpool(_fetch_rows, select(
+            ResearchSession.id,
+            ResearchSession.title,
+            ResearchSession.description,
+            ResearchSession.query,
+            ResearchSession.status,
+            ResearchSession.created_at
+        ).where(ResearchSession.id == session_id)),
+        run_in_threadpool(_fetch_rows, _messages_stmt(session_id)),
+        run_in_threadpool(_fetch_rows, _agent_results_stmt(session_id))
+    )
+    if not session_rows:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return {"session": session_rows[0], "messages": messages, "agent_results": agent_results}
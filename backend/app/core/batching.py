@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any, List, Optional, Set, Tuple
+
+
+class AsyncBatcher:
+    """
+    Coalesces concurrent submit() calls into batches of up to
+    `max_batch_size` items, waiting at most `max_queue_time` seconds for a
+    batch to fill. Subclasses implement process_batch, which must return
+    one result per item in order.
+    """
+
+    def __init__(self, max_batch_size: int = 16, max_queue_time: float = 0.05):
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to tasks; hold in-flight batches here
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def process_batch(self, items: List[Any]) -> List[Any]:
+        raise NotImplementedError
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_queue_time, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        try:
+            results = await self.process_batch(items)
+            if len(results) != len(items):
+                raise ValueError(f"Expected {len(items)} results, got {len(results)}")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -1,10 +1,14 @@
 from pydantic import BaseSettings
 from typing import Optional
 import os
+import tempfile
 
 class Settings(BaseSettings):
     # Database
-    DATABASE_URL: str = "sqlite:///./pharmashe.db"
+    DATABASE_URL: str = "sqlite:///./pharmashe.db"  # local development only; production needs Postgres
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE: int = 300  # seconds
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
@@ -27,6 +31,9 @@ class Settings(BaseSettings):
     # External APIs
     CLINICAL_TRIALS_API_URL: str = "https://clinicaltrials.gov/api/v2"
     USPTO_API_URL: str = "https://developer.uspto.gov/ibd-api/v1"
+    # On-disk cache for PubMed/USPTO responses; the Docker image points this at /var/cache/pharmashe
+    HTTP_CACHE_DIR: str = os.path.join(tempfile.gettempdir(), "pharmashe-http-cache")
+    HTTP_CACHE_TTL: int = 3600  # seconds
     
     # File uploads
     UPLOAD_DIR: str = "uploads"
@@ -5,15 +5,27 @@ from app.core.config import settings
 
 # Handle SQLite specific configuration
 connect_args = {}
+engine_kwargs = {}
 if "sqlite" in settings.DATABASE_URL:
+    # SQLite serializes all writers; fine for a laptop, not for concurrent API traffic
+    if settings.ENVIRONMENT == "production":
+        raise RuntimeError("SQLite is not supported in production; set DATABASE_URL to a Postgres database")
     connect_args["check_same_thread"] = False
+else:
+    # Sized for FastAPI's threadpool: sync endpoints each hold one connection while they run
+    engine_kwargs.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE
+    )
 
 # Create database engine
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
     echo=settings.DEBUG,
-    connect_args=connect_args
+    connect_args=connect_args,
+    **engine_kwargs
 )
 
 # Create session factory
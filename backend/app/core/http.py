@@ -0,0 +1,19 @@
+import asyncio
+import httpx
+
+# One pooled HTTP/2 client for every outbound API call in the process, so
+# connections and TLS sessions are reused instead of re-opened per wrapper
+HTTP = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=50,
+        keepalive_expiry=60
+    )
+)
+
+async def close_http():
+    """Close the shared client at shutdown; a close that hangs is cancelled rather than waited on."""
+    async with asyncio.timeout(5):
+        await HTTP.aclose()
@@ -1,4 +1,7 @@
-from typing import Any
+from typing import Any, Iterable, Iterator
+import hashlib
+import orjson
+from fastapi import Request
 
 class APIResponse:
     @staticmethod
@@ -9,3 +12,25 @@ class APIResponse:
     def error(message: str, code: int = 1, data: Any = None) -> dict:
         # The 'code' parameter is kept for compatibility but not used in the final dict
         return {"status": False, "message": message, "data": data}
+
+def iter_json_array(items: Iterable[Any]) -> Iterator[bytes]:
+    """Encode items as one JSON array, element by element, for use with StreamingResponse."""
+    yield b"["
+    for i, item in enumerate(items):
+        if i:
+            yield b","
+        yield orjson.dumps(item)
+    yield b"]"
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from a resource's version parts (e.g. row count and latest timestamp)."""
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=8).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match already names this ETag (weak or strong)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
@@ -1,4 +1,5 @@
 import os
+import functools
 import vertexai
 from vertexai.generative_models import GenerativeModel
 
@@ -6,13 +7,16 @@ from vertexai.generative_models import GenerativeModel
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "gen-lang-client-0786690668")
 LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
 
+@functools.lru_cache(maxsize=1)
 def init_vertex_ai():
-    """Initializes the Vertex AI SDK with the specific project."""
+    """Initializes the Vertex AI SDK with the specific project (once per process)."""
     vertexai.init(project=PROJECT_ID, location=LOCATION)
 
+@functools.lru_cache(maxsize=None)
 def get_gemini_model(model_name: str = "gemini-1.5-flash") -> GenerativeModel:
     """
     Returns a configured GenerativeModel instance connected to the project.
+    Instances are cached per model name and shared across callers.
     """
     init_vertex_ai()
-    return GenerativeModel(model_name)
\ No newline at end of file
+    return GenerativeModel(model_name)
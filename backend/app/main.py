@@ -1,18 +1,22 @@
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 import uvicorn
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Optional
 
 from app.core.config import settings
 from app.core.database import get_db, engine
 from app.core.responses import APIResponse
+from app.core.http import close_http
 from app.models import models
 from app.api import agents, research, reports, auth, external_apis
-from app.services.master_agent import MasterAgent
+from app.services.master_agent import MasterAgent, get_master_agent
+from app.services.external_apis import ExternalAPIService
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
@@ -22,9 +26,25 @@ app = FastAPI(
     description="Women-Centric Cancer Pharmaceutical Platform API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
+# Any error a route doesn't turn into an HTTPException itself ends up here,
+# so handlers don't each need their own try/except. This is a middleware rather
+# than an Exception handler because Starlette runs those outside CORSMiddleware,
+# which would strip the CORS headers from every 500; registered before CORS so
+# CORS wraps it.
+@app.middleware("http")
+async def _unhandled_exception(request, call_next):
+    try:
+        return await call_next(request)
+    except Exception as exc:
+        return ORJSONResponse(
+            status_code=500,
+            content=APIResponse.error(f"An unexpected error occurred: {str(exc)}")
+        )
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -37,8 +57,34 @@ app.add_middleware(
 # Security
 security = HTTPBearer()
 
-# Initialize Master Agent
-master_agent = MasterAgent()
+# Initialize the Master Agent once; routes receive it through get_master_agent
+app.state.master_agent = MasterAgent()
+
+# Created once, like the Master Agent; routes receive it through get_external_api_service
+app.state.external_api_service = ExternalAPIService()
+
+@app.on_event("startup")
+def _ensure_dirs():
+    # Created once here so request handlers can write without checking
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    os.makedirs("reports", exist_ok=True)
+
+@app.on_event("startup")
+def _start_cpu_pool():
+    # CPU-bound work (PDF/Excel rendering) runs here so it can't block the event loop.
+    # Spawned, not forked: this process already holds gRPC channels, the HTTP/2 client and pooled DB sockets
+    app.state.cpu_pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+@app.on_event("shutdown")
+def _stop_cpu_pool():
+    app.state.cpu_pool.shutdown(wait=False, cancel_futures=True)
+
+@app.on_event("shutdown")
+async def _close_http_client():
+    await close_http()
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
@@ -64,30 +110,26 @@ async def chat_endpoint(
     message: str,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    master_agent: MasterAgent = Depends(get_master_agent)
 ):
     """
     Main chat endpoint for interacting with the Master Agent
     """
-    try:
-        # Process the query through Master Agent
-        response = await master_agent.process_query(
-            query=message,
-            db=db,
-            background_tasks=background_tasks
-        )
-        
-        return APIResponse.success(response)
-    except Exception as e:
-        return JSONResponse(
-            status_code=500,
-            content=APIResponse.error(f"An unexpected error occurred: {str(e)}")
-        )
+    # Process the query through Master Agent
+    response = await master_agent.process_query(
+        query=message,
+        db=db,
+        background_tasks=background_tasks
+    )
+    
+    return APIResponse.success(response)
 
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=True,
+        http="httptools"
     )
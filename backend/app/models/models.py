@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON, Float, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
 
+# Binary, pre-parsed JSONB on Postgres (matching database/init.sql); plain JSON elsewhere (e.g. SQLite)
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 class User(Base):
     __tablename__ = "users"
     
@@ -22,6 +26,10 @@ class User(Base):
 
 class ResearchSession(Base):
     __tablename__ = "research_sessions"
+    __table_args__ = (
+        # Index-backed max(updated_at) for the session list's ETag
+        Index("ix_session_updated", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -39,12 +47,16 @@ class ResearchSession(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Messages for a session in time order; also serves plain session_id lookups
+        Index("ix_msg_session_created", "session_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("research_sessions.id"), nullable=False)
     role = Column(String, nullable=False)  # user, assistant, system
     content = Column(Text, nullable=False)
-    message_metadata = Column(JSON)  # Additional data like agent results, sources, etc.
+    message_metadata = Column("metadata", JSONType)  # Additional data like agent results, sources, etc.
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
@@ -52,12 +64,16 @@ class ChatMessage(Base):
 
 class AgentResult(Base):
     __tablename__ = "agent_results"
+    __table_args__ = (
+        # Containment (@>) lookups into result payloads; GIN applies on Postgres only
+        Index("ix_agent_result_data_gin", "result_data", postgresql_using="gin"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("research_sessions.id"), nullable=False)
+    session_id = Column(Integer, ForeignKey("research_sessions.id"), nullable=False, index=True)
     agent_type = Column(String, nullable=False)  # iqvia, patent, clinical_trials, etc.
     query = Column(Text, nullable=False)
-    result_data = Column(JSON, nullable=False)
+    result_data = Column(JSONType, nullable=False)
     status = Column(String, default="completed")  # pending, completed, failed
     error_message = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -69,12 +85,12 @@ class Report(Base):
     __tablename__ = "reports"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    session_id = Column(Integer, ForeignKey("research_sessions.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(Integer, ForeignKey("research_sessions.id"), index=True)
     title = Column(String, nullable=False)
     report_type = Column(String, nullable=False)  # pdf, excel, json
     file_path = Column(String)
-    report_metadata = Column(JSON)
+    report_metadata = Column("metadata", JSONType)  # column name matches database/init.sql
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
@@ -86,11 +102,11 @@ class Drug(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
     generic_name = Column(String, index=True)
-    brand_names = Column(JSON)  # List of brand names
+    brand_names = Column(JSONType)  # List of brand names
     drug_class = Column(String)
     mechanism_of_action = Column(Text)
-    indications = Column(JSON)  # List of approved indications
-    dosage_forms = Column(JSON)  # List of available dosage forms
+    indications = Column(JSONType)  # List of approved indications
+    dosage_forms = Column(JSONType)  # List of available dosage forms
     manufacturer = Column(String)
     patent_expiry = Column(DateTime)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -143,6 +159,6 @@ class MarketData(Base):
     year = Column(Integer, index=True)
     market_size = Column(Float)  # In USD millions
     growth_rate = Column(Float)  # CAGR percentage
-    competitor_data = Column(JSON)
+    competitor_data = Column(JSONType)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import Iterable, List, Dict
 from pydantic import BaseModel
 
 class Evidence(BaseModel):
@@ -6,8 +6,16 @@ class Evidence(BaseModel):
     finding: str
     rank: int
 
+    @staticmethod
+    def dump_many(items: Iterable["Evidence"]) -> List[Dict]:
+        """
+        Serialize a list of Evidence in one pass. The fields are all scalars, so the shallow
+        dict(e) gives the same result as e.dict() without its per-call include/exclude handling.
+        """
+        return [dict(e) for e in items]
+
 class ResearchState(BaseModel):
     biological_focus: str
     evidence: List[Evidence] = []
     rrf_score: float = 0.0
-    logs: List[str] = []
\ No newline at end of file
+    logs: List[str] = []
@@ -1,12 +1,15 @@
-from typing import Dict, List, Any, Optional
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Tuple
 import asyncio
 import logging
+from collections import Counter
+from fastapi import Request
 from datetime import datetime, timedelta
 
 from .clinical_trials_api import ClinicalTrialsAPI
 from .uspto_api import USPTOAPI
 from .pubmed_api import PubMedAPI
 from .fda_api import FDADrugAPI
+from .cache import ttl_cache, ONE_HOUR, ONE_DAY
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +19,7 @@ class ExternalAPIService:
     """
     
     def __init__(self):
+        # The wrappers all default to the process-wide pooled client in app.core.http
         self.clinical_trials_api = ClinicalTrialsAPI()
         self.uspto_api = USPTOAPI()
         self.pubmed_api = PubMedAPI()
@@ -35,95 +39,20 @@ class ExternalAPIService:
         Perform comprehensive research across all available APIs
         """
         try:
-            tasks = []
-            
-            # Clinical Trials
-            if include_clinical_trials:
-                if therapeutic_area:
-                    tasks.append(self.clinical_trials_api.search_trials(condition=therapeutic_area))
-                elif drug_name:
-                    tasks.append(self.clinical_trials_api.search_trials(intervention=drug_name))
-                else:
-                    tasks.append(self.clinical_trials_api.search_trials(condition="cancer"))
-            
-            # Patents
-            if include_patents:
-                if drug_name:
-                    tasks.append(self.uspto_api.search_patents_by_drug(drug_name))
-                elif therapeutic_area:
-                    tasks.append(self.uspto_api.search_patents_by_therapeutic_area(therapeutic_area))
-                else:
-                    tasks.append(self.uspto_api.search_patents("cancer treatment"))
-            
-            # Literature
-            if include_literature:
-                if drug_name:
-                    tasks.append(self.pubmed_api.search_by_drug(drug_name))
-                elif therapeutic_area:
-                    tasks.append(self.pubmed_api.search_by_therapeutic_area(therapeutic_area))
-                else:
-                    tasks.append(self.pubmed_api.search_articles("women cancer"))
-            
-            # FDA Data
-            if include_fda_data:
-                if drug_name:
-                    tasks.append(self.fda_api.search_drugs(drug_name))
-                else:
-                    tasks.append(self.fda_api.search_oncology_drugs())
-            
-            # Execute all tasks concurrently
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Process results
-            comprehensive_data = {
-                "query": query,
-                "therapeutic_area": therapeutic_area,
-                "drug_name": drug_name,
-                "timestamp": datetime.now().isoformat(),
-                "clinical_trials": [],
-                "patents": [],
-                "literature": [],
-                "fda_data": [],
-                "errors": []
+            enabled = {
+                "clinical_trials": include_clinical_trials,
+                "patents": include_patents,
+                "literature": include_literature,
+                "fda_data": include_fda_data
             }
+            sources = [
+                source for source in self._research_sources(therapeutic_area, drug_name)
+                if enabled[source[0]]
+            ]
             
-            result_index = 0
-            
-            if include_clinical_trials:
-                if result_index < len(results):
-                    result = results[result_index]
-                    if isinstance(result, Exception):
-                        comprehensive_data["errors"].append(f"Clinical Trials API error: {str(result)}")
-                    else:
-                        comprehensive_data["clinical_trials"] = result.get("trials", [])
-                    result_index += 1
-            
-            if include_patents:
-                if result_index < len(results):
-                    result = results[result_index]
-                    if isinstance(result, Exception):
-                        comprehensive_data["errors"].append(f"USPTO API error: {str(result)}")
-                    else:
-                        comprehensive_data["patents"] = result.get("patents", [])
-                    result_index += 1
-            
-            if include_literature:
-                if result_index < len(results):
-                    result = results[result_index]
-                    if isinstance(result, Exception):
-                        comprehensive_data["errors"].append(f"PubMed API error: {str(result)}")
-                    else:
-                        comprehensive_data["literature"] = result.get("articles", [])
-                    result_index += 1
+            comprehensive_data = self._research_data(query, therapeutic_area, drug_name)
             
-            if include_fda_data:
-                if result_index < len(results):
-                    result = results[result_index]
-                    if isinstance(result, Exception):
-                        comprehensive_data["errors"].append(f"FDA API error: {str(result)}")
-                    else:
-                        comprehensive_data["fda_data"] = result.get("drugs", [])
-                    result_index += 1
+            await self._collect(sources, comprehensive_data)
             
             return comprehensive_data
             
@@ -131,6 +60,8 @@ class ExternalAPIService:
             logger.error(f"Error in comprehensive research: {str(e)}")
             return {"error": str(e), "query": query}
     
+    # Served stale for up to a day while a background refresh runs
+    @ttl_cache(ONE_HOUR, stale=ONE_DAY)
     async def get_market_intelligence(
         self,
         therapeutic_area: str,
@@ -140,24 +71,13 @@ class ExternalAPIService:
         Get market intelligence data for a specific therapeutic area
         """
         try:
-            tasks = []
-            
-            # Get clinical trials
-            tasks.append(self.clinical_trials_api.search_trials(condition=therapeutic_area, limit=50))
-            
-            # Get patents
-            tasks.append(self.uspto_api.search_patents_by_therapeutic_area(therapeutic_area, limit=50))
-            
-            # Get recent literature
-            tasks.append(self.pubmed_api.search_recent_articles(f"{therapeutic_area} women", days=90, max_results=30))
-            
-            # Get FDA data
-            if drug_name:
-                tasks.append(self.fda_api.search_drugs(drug_name, limit=20))
-            else:
-                tasks.append(self.fda_api.search_oncology_drugs(limit=20))
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            # (category, call, response key, insight counted from the results)
+            sources = [
+                ("clinical_trials", lambda: self.clinical_trials_api.search_trials(condition=therapeutic_area, limit=50), "trials", "total_trials"),
+                ("patents", lambda: self.uspto_api.search_patents_by_therapeutic_area(therapeutic_area, limit=50), "patents", "total_patents"),
+                ("recent_literature", lambda: self.pubmed_api.search_recent_articles(f"{therapeutic_area} women", days=90, max_results=30), "articles", "recent_publications"),
+                ("fda_drugs", (lambda: self.fda_api.search_drugs(drug_name, limit=20)) if drug_name else (lambda: self.fda_api.search_oncology_drugs(limit=20)), "drugs", None)
+            ]
             
             market_intelligence = {
                 "therapeutic_area": therapeutic_area,
@@ -170,37 +90,21 @@ class ExternalAPIService:
                 "market_insights": {},
                 "errors": []
             }
-            
-            # Process clinical trials
-            if len(results) > 0 and not isinstance(results[0], Exception):
-                trials_data = results[0]
-                market_intelligence["clinical_trials"] = trials_data.get("trials", [])
-                
-                # Extract market insights from trials
-                active_trials = [t for t in trials_data.get("trials", []) if t.get("status") == "Recruiting"]
-                market_intelligence["market_insights"]["active_trials"] = len(active_trials)
-                market_intelligence["market_insights"]["total_trials"] = len(trials_data.get("trials", []))
-            
-            # Process patents
-            if len(results) > 1 and not isinstance(results[1], Exception):
-                patents_data = results[1]
-                market_intelligence["patents"] = patents_data.get("patents", [])
+            insights = market_intelligence["market_insights"]
+            
+            dispatch = {category: (key, insight) for category, _, key, insight in sources}
+            tasks = {category: make_call() for category, make_call, _, _ in sources}
+            async for category, result in self._as_completed(tasks):
+                if isinstance(result, Exception):
+                    market_intelligence["errors"].append(f"{category} error: {str(result)}")
+                    continue
                 
-                # Extract patent insights
-                market_intelligence["market_insights"]["total_patents"] = len(patents_data.get("patents", []))
-            
-            # Process literature
-            if len(results) > 2 and not isinstance(results[2], Exception):
-                literature_data = results[2]
-                market_intelligence["recent_literature"] = literature_data.get("articles", [])
-                
-                # Extract research activity insights
-                market_intelligence["market_insights"]["recent_publications"] = len(literature_data.get("articles", []))
-            
-            # Process FDA data
-            if len(results) > 3 and not isinstance(results[3], Exception):
-                fda_data = results[3]
-                market_intelligence["fda_drugs"] = fda_data.get("drugs", [])
+                key, insight = dispatch[category]
+                items = market_intelligence[category] = result.get(key, [])
+                if insight:
+                    insights[insight] = len(items)
+                if category == "clinical_trials":
+                    insights["active_trials"] = sum(1 for t in items if t.get("status") == "Recruiting")
             
             return market_intelligence
             
@@ -217,12 +121,21 @@ class ExternalAPIService:
         Get competitive landscape analysis
         """
         try:
-            # Get comprehensive data
-            comprehensive_data = await self.search_comprehensive_research(
-                query=f"{therapeutic_area} competitive analysis",
-                therapeutic_area=therapeutic_area,
-                drug_name=drug_name
+            # Fetch the comprehensive-research sources and, for a named drug,
+            # its FDA adverse events and recalls in one concurrent round
+            sources = self._research_sources(therapeutic_area, drug_name)
+            comprehensive_data = self._research_data(
+                f"{therapeutic_area} competitive analysis", therapeutic_area, drug_name
             )
+            if drug_name:
+                sources += [
+                    ("fda_events", lambda: self.fda_api.get_drug_events(drug_name), "events", "FDA adverse events API"),
+                    ("fda_recalls", lambda: self.fda_api.get_drug_recalls(drug_name), "recalls", "FDA recalls API")
+                ]
+                comprehensive_data["fda_events"] = []
+                comprehensive_data["fda_recalls"] = []
+            
+            await self._collect(sources, comprehensive_data)
             
             # Analyze competitive landscape
             competitive_analysis = {
@@ -235,50 +148,7 @@ class ExternalAPIService:
                 "threats": [],
                 "data_sources": comprehensive_data
             }
-            
-            # Analyze clinical trials for competitors
-            trials = comprehensive_data.get("clinical_trials", [])
-            sponsors = {}
-            for trial in trials:
-                sponsor = trial.get("sponsor", "Unknown")
-                if sponsor not in sponsors:
-                    sponsors[sponsor] = 0
-                sponsors[sponsor] += 1
-            
-            # Top competitors by trial activity
-            top_sponsors = sorted(sponsors.items(), key=lambda x: x[1], reverse=True)[:10]
-            competitive_analysis["competitors"] = [
-                {"company": sponsor, "trial_count": count} 
-                for sponsor, count in top_sponsors
-            ]
-            
-            # Analyze patents for IP landscape
-            patents = comprehensive_data.get("patents", [])
-            assignees = {}
-            for patent in patents:
-                assignee = patent.get("assignee", "Unknown")
-                if assignee not in assignees:
-                    assignees[assignee] = 0
-                assignees[assignee] += 1
-            
-            # Top patent holders
-            top_assignees = sorted(assignees.items(), key=lambda x: x[1], reverse=True)[:10]
-            competitive_analysis["ip_landscape"] = [
-                {"company": assignee, "patent_count": count} 
-                for assignee, count in top_assignees
-            ]
-            
-            # Identify market gaps and opportunities
-            if len(trials) < 20:
-                competitive_analysis["opportunities"].append("Low clinical trial activity - potential for new entrants")
-            
-            if len(patents) < 50:
-                competitive_analysis["opportunities"].append("Limited patent landscape - freedom to operate opportunities")
-            
-            # Recent literature analysis
-            literature = comprehensive_data.get("literature", [])
-            if len(literature) > 50:
-                competitive_analysis["threats"].append("High research activity - competitive market")
+            self._analyze_competition(competitive_analysis, comprehensive_data)
             
             return competitive_analysis
             
@@ -286,12 +156,138 @@ class ExternalAPIService:
             logger.error(f"Error getting competitive landscape: {str(e)}")
             return {"error": str(e), "therapeutic_area": therapeutic_area}
     
-    async def close(self):
-        """Close all API clients"""
-        await asyncio.gather(
-            self.clinical_trials_api.close(),
-            self.uspto_api.close(),
-            self.pubmed_api.close(),
-            self.fda_api.close(),
-            return_exceptions=True
-        )
+    def _analyze_competition(self, competitive_analysis: Dict[str, Any], comprehensive_data: Dict[str, Any]):
+        """
+        Fill competitors, IP landscape, opportunities and threats from the fetched data
+        """
+        # Analyze clinical trials for competitors
+        trials = comprehensive_data.get("clinical_trials", [])
+        sponsors = Counter(trial.get("sponsor", "Unknown") for trial in trials)
+        
+        # Top competitors by trial activity
+        competitive_analysis["competitors"] = [
+            {"company": sponsor, "trial_count": count} 
+            for sponsor, count in sponsors.most_common(10)
+        ]
+        
+        # Analyze patents for IP landscape
+        patents = comprehensive_data.get("patents", [])
+        assignees = Counter(patent.get("assignee", "Unknown") for patent in patents)
+        
+        # Top patent holders
+        competitive_analysis["ip_landscape"] = [
+            {"company": assignee, "patent_count": count} 
+            for assignee, count in assignees.most_common(10)
+        ]
+        
+        # Identify market gaps and opportunities
+        if len(trials) < 20:
+            competitive_analysis["opportunities"].append("Low clinical trial activity - potential for new entrants")
+        
+        if len(patents) < 50:
+            competitive_analysis["opportunities"].append("Limited patent landscape - freedom to operate opportunities")
+        
+        # Recent literature analysis
+        literature = comprehensive_data.get("literature", [])
+        if len(literature) > 50:
+            competitive_analysis["threats"].append("High research activity - competitive market")
+    
+    def _research_data(
+        self,
+        query: str,
+        therapeutic_area: Optional[str],
+        drug_name: Optional[str]
+    ) -> Dict[str, Any]:
+        """Empty comprehensive-research result for _collect to fill"""
+        return {
+            "query": query,
+            "therapeutic_area": therapeutic_area,
+            "drug_name": drug_name,
+            "timestamp": datetime.now().isoformat(),
+            "clinical_trials": [],
+            "patents": [],
+            "literature": [],
+            "fda_data": [],
+            "errors": []
+        }
+    
+    async def _collect(self, sources: List[Tuple[str, Callable[[], Awaitable], str, str]], data: Dict[str, Any]):
+        """
+        Run the sources concurrently, storing each result's items under its
+        category in `data` and failures in data["errors"]
+        """
+        dispatch = {category: (key, label) for category, _, key, label in sources}
+        tasks = {category: make_call() for category, make_call, _, _ in sources}
+        async for category, result in self._as_completed(tasks):
+            key, label = dispatch[category]
+            if isinstance(result, Exception):
+                data["errors"].append(f"{label} error: {str(result)}")
+            else:
+                data[category] = result.get(key, [])
+    
+    def _research_sources(
+        self,
+        therapeutic_area: Optional[str],
+        drug_name: Optional[str]
+    ) -> List[Tuple[str, Callable[[], Awaitable], str, str]]:
+        """
+        (category, call, response key, API label) for each upstream that
+        search_comprehensive_research can query; calls are created lazily.
+        """
+        if therapeutic_area:
+            trials = lambda: self.clinical_trials_api.search_trials(condition=therapeutic_area)
+        elif drug_name:
+            trials = lambda: self.clinical_trials_api.search_trials(intervention=drug_name)
+        else:
+            trials = lambda: self.clinical_trials_api.search_trials(condition="cancer")
+        
+        if drug_name:
+            patents = lambda: self.uspto_api.search_patents_by_drug(drug_name)
+            literature = lambda: self.pubmed_api.search_by_drug(drug_name)
+            fda = lambda: self.fda_api.search_drugs(drug_name)
+        elif therapeutic_area:
+            patents = lambda: self.uspto_api.search_patents_by_therapeutic_area(therapeutic_area)
+            literature = lambda: self.pubmed_api.search_by_therapeutic_area(therapeutic_area)
+            fda = lambda: self.fda_api.search_oncology_drugs()
+        else:
+            patents = lambda: self.uspto_api.search_patents("cancer treatment")
+            literature = lambda: self.pubmed_api.search_articles("women cancer")
+            fda = lambda: self.fda_api.search_oncology_drugs()
+        
+        return [
+            ("clinical_trials", trials, "trials", "Clinical Trials API"),
+            ("patents", patents, "patents", "USPTO API"),
+            ("literature", literature, "articles", "PubMed API"),
+            ("fda_data", fda, "drugs", "FDA API")
+        ]
+    
+    async def _as_completed(self, tasks: Dict[str, Awaitable], timeout: float = 15):
+        """
+        Run the named calls concurrently and yield (name, result) pairs in
+        completion order. A call that raised yields its exception; calls
+        still running after `timeout` are cancelled and yield TimeoutError.
+        """
+        async def tagged(name, coro):
+            try:
+                return name, await coro
+            except Exception as e:
+                return name, e
+        
+        pending = [asyncio.ensure_future(tagged(name, coro)) for name, coro in tasks.items()]
+        done = set()
+        try:
+            for next_done in asyncio.as_completed(pending, timeout=timeout):
+                name, result = await next_done
+                done.add(name)
+                yield name, result
+        except asyncio.TimeoutError:
+            for task in pending:
+                task.cancel()
+            for name in tasks:
+                if name not in done:
+                    yield name, asyncio.TimeoutError(f"no response within {timeout}s")
+
+
+def get_external_api_service(request: Request) -> ExternalAPIService:
+    """FastAPI dependency: the single ExternalAPIService that app.main stores on app.state."""
+    return request.app.state.external_api_service
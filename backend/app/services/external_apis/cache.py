@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+import diskcache
+import httpx
+
+from app.core.config import settings
+from .rate_limit import get_with_retry
+
+ONE_HOUR = 60 * 60
+ONE_DAY = 24 * ONE_HOUR
+ONE_WEEK = 7 * ONE_DAY
+
+
+def _cache_key(name: str, owner: Any, args: tuple, kwargs: dict) -> str:
+    payload = json.dumps(
+        {
+            "method": name,
+            "base_url": getattr(owner, "base_url", None),
+            "args": args,
+            "kwargs": kwargs
+        },
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def ttl_cache(ttl: float, stale: float = 0, maxsize: int = 1024):
+    """
+    Cache an async API method's result for `ttl` seconds, keyed by method
+    name and arguments. With `stale` > 0, an expired entry younger than
+    ttl + stale is returned immediately while a background task refreshes it.
+    Results carrying an "error" key or a non-empty "errors" list are never
+    cached.
+    """
+    def decorator(func):
+        entries: Dict[str, Tuple[float, Any]] = {}
+        refreshing: Dict[str, asyncio.Task] = {}
+
+        def _store(key, result):
+            if "error" in result or result.get("errors"):
+                return
+            entries.pop(key, None)
+            entries[key] = (time.monotonic(), result)
+            # Dicts keep insertion order, so the first key is the oldest write
+            if len(entries) > maxsize:
+                del entries[next(iter(entries))]
+
+        async def _refresh(key, args, kwargs):
+            try:
+                _store(key, await func(*args, **kwargs))
+            finally:
+                refreshing.pop(key, None)
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            key = _cache_key(func.__qualname__, self, args, kwargs)
+            cached = entries.get(key)
+            if cached is not None:
+                stored_at, result = cached
+                age = time.monotonic() - stored_at
+                if age < ttl:
+                    return result
+                if age < ttl + stale:
+                    if key not in refreshing:
+                        refreshing[key] = asyncio.create_task(
+                            _refresh(key, (self, *args), kwargs)
+                        )
+                    return result
+
+            result = await func(self, *args, **kwargs)
+            _store(key, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+@functools.lru_cache(maxsize=1)
+def _disk_cache() -> diskcache.Cache:
+    """The on-disk response cache, opened once per process"""
+    return diskcache.Cache(settings.HTTP_CACHE_DIR)
+
+
+def _disk_get(key: str) -> Optional[bytes]:
+    return _disk_cache().get(key)
+
+
+def _disk_set(key: str, content: bytes, ttl: int):
+    _disk_cache().set(key, content, expire=ttl)
+
+
+async def cached_get(
+    client: httpx.AsyncClient,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    ttl: Optional[int] = None
+) -> bytes:
+    """
+    Body of a GET request, served from the on-disk cache while it is
+    younger than `ttl` seconds (HTTP_CACHE_TTL by default). Misses go out
+    through get_with_retry; the cache is shared by every worker process.
+    diskcache is blocking SQLite and file I/O, so it runs on worker threads.
+    """
+    query = urlencode(sorted((params or {}).items()))
+    key = hashlib.blake2b(f"{url}?{query}".encode()).hexdigest()
+    
+    content = await asyncio.to_thread(_disk_get, key)
+    if content is None:
+        response = await get_with_retry(client, url, params=params)
+        content = response.content
+        await asyncio.to_thread(_disk_set, key, content, ttl or settings.HTTP_CACHE_TTL)
+    return content
@@ -1,21 +1,67 @@
 import httpx
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
+import functools
 import json
 import logging
+from operator import itemgetter
+import ijson
+import orjson
+from urllib.parse import quote, urlencode
+
+from app.core.http import HTTP
+from .rate_limit import get_with_retry
+from .cache import ttl_cache, ONE_HOUR
 
 logger = logging.getLogger(__name__)
 
+_ID_GET = itemgetter("nctId", "briefTitle", "officialTitle")
+
+@functools.lru_cache(maxsize=512)
+def _trial_search_url(
+    base_url: str,
+    condition: Optional[str],
+    intervention: Optional[str],
+    phase: Optional[str],
+    status: Optional[str],
+    limit: int
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Study search URL with its query string already encoded, plus the params
+    it encodes; repeated searches reuse both instead of re-encoding
+    """
+    params = {
+        "format": "json",
+        "limit": limit,
+        "offset": 0
+    }
+    
+    if condition:
+        params["condition"] = condition
+    if intervention:
+        params["intervention"] = intervention
+    if phase:
+        params["phase"] = phase
+    if status:
+        params["status"] = status
+    
+    return f"{base_url}/studies?{urlencode(params, quote_via=quote)}", params
+
 class ClinicalTrialsAPI:
     """
     Integration with ClinicalTrials.gov API
     """
     
-    def __init__(self, base_url: str = "https://clinicaltrials.gov/api/v2"):
+    def __init__(
+        self,
+        base_url: str = "https://clinicaltrials.gov/api/v2",
+        client: Optional[httpx.AsyncClient] = None
+    ):
         self.base_url = base_url
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = client or HTTP
     
+    @ttl_cache(ONE_HOUR)
     async def search_trials(
         self, 
         condition: Optional[str] = None,
@@ -28,34 +74,37 @@ class ClinicalTrialsAPI:
         Search clinical trials with various filters
         """
         try:
-            params = {
-                "format": "json",
-                "limit": limit,
-                "offset": 0
-            }
+            url, params = _trial_search_url(self.base_url, condition, intervention, phase, status, limit)
             
-            if condition:
-                params["condition"] = condition
-            if intervention:
-                params["intervention"] = intervention
-            if phase:
-                params["phase"] = phase
-            if status:
-                params["status"] = status
-            
-            response = await self.client.get(f"{self.base_url}/studies", params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # Process and normalize the data
+            # Parse the page as it streams in and normalize each study as soon
+            # as it is complete, so the raw payload is never held in full
+            total_count = 0
             processed_trials = []
-            for study in data.get("studies", []):
-                trial_data = self._process_trial_data(study)
-                processed_trials.append(trial_data)
+            events = ijson.sendable_list()
+            parser = ijson.parse_coro(events, use_float=True)
+            builder = None
+            
+            response = await get_with_retry(self.client, url, stream=True)
+            try:
+                async for chunk in response.aiter_bytes():
+                    parser.send(chunk)
+                    for prefix, event, value in events:
+                        if prefix == "totalCount":
+                            total_count = value
+                        elif prefix == "studies.item" and event == "start_map":
+                            builder = ijson.ObjectBuilder()
+                        if builder is not None:
+                            builder.event(event, value)
+                            if prefix == "studies.item" and event == "end_map":
+                                processed_trials.append(self._process_trial_data(builder.value))
+                                builder = None
+                    del events[:]
+                parser.close()
+            finally:
+                await response.aclose()
             
             return {
-                "total_count": data.get("totalCount", 0),
+                "total_count": total_count,
                 "trials": processed_trials,
                 "search_params": params
             }
@@ -76,10 +125,18 @@ class ClinicalTrialsAPI:
         interventions_module = protocol_section.get("interventionsModule", {})
         sponsor_module = protocol_section.get("sponsorCollaboratorsModule", {})
         
+        # Most records carry all three ids; only fall back to per-key .get() when one is missing
+        try:
+            nct_id, title, official_title = _ID_GET(identification_module)
+        except KeyError:
+            nct_id = identification_module.get("nctId")
+            title = identification_module.get("briefTitle")
+            official_title = identification_module.get("officialTitle")
+        
         return {
-            "nct_id": identification_module.get("nctId"),
-            "title": identification_module.get("briefTitle"),
-            "official_title": identification_module.get("officialTitle"),
+            "nct_id": nct_id,
+            "title": title,
+            "official_title": official_title,
             "status": status_module.get("overallStatus"),
             "phase": self._extract_phase(design_module),
             "study_type": design_module.get("studyType"),
@@ -90,7 +147,7 @@ class ClinicalTrialsAPI:
             "completion_date": status_module.get("completionDateStruct", {}).get("date"),
             "enrollment": design_module.get("enrollmentInfo", {}).get("count"),
             "locations": self._extract_locations(protocol_section),
-            "url": f"https://clinicaltrials.gov/study/{identification_module.get('nctId')}"
+            "url": f"https://clinicaltrials.gov/study/{nct_id}"
         }
     
     def _extract_phase(self, design_module: Dict[str, Any]) -> Optional[str]:
@@ -116,10 +173,9 @@ class ClinicalTrialsAPI:
         Get detailed information for a specific trial
         """
         try:
-            response = await self.client.get(f"{self.base_url}/studies/{nct_id}")
-            response.raise_for_status()
+            response = await get_with_retry(self.client, f"{self.base_url}/studies/{nct_id}")
             
-            data = response.json()
+            data = orjson.loads(response.content)
             return self._process_trial_data(data)
             
         except Exception as e:
@@ -131,7 +187,3 @@ class ClinicalTrialsAPI:
         Get trials by sponsor name
         """
         return await self.search_trials(limit=limit)
-    
-    async def close(self):
-        """Close the HTTP client"""
-        await self.client.aclose()
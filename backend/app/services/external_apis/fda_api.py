@@ -1,21 +1,75 @@
 import httpx
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
+import functools
 import json
 import logging
+import orjson
+from urllib.parse import quote, urlencode
+
+from app.core.http import HTTP
+from .rate_limit import get_with_retry
+from .cache import ttl_cache, ONE_DAY, ONE_WEEK
 
 logger = logging.getLogger(__name__)
 
+ONCOLOGY_TERMS = ("cancer", "oncology", "tumor", "neoplasm", "carcinoma", "sarcoma", "lymphoma", "leukemia")
+
+@functools.lru_cache(maxsize=512)
+def _drug_search_url(base_url: str, search_term: str, limit: int, skip: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Label search URL with its query string already encoded, plus the params
+    it encodes; repeated searches reuse both instead of re-encoding
+    """
+    params = {
+        "search": f"openfda.brand_name:{search_term} OR openfda.generic_name:{search_term}",
+        "limit": limit,
+        "skip": skip
+    }
+    return f"{base_url}/drug/label.json?{urlencode(params, quote_via=quote)}", params
+
+def _first(record: Dict[str, Any], key: str, default: str = "") -> str:
+    """First entry of an openFDA list field, or `default` when it is missing or empty"""
+    values = record.get(key)
+    return values[0] if values else default
+
 class FDADrugAPI:
     """
     Integration with FDA Drug API
     """
     
-    def __init__(self, base_url: str = "https://api.fda.gov"):
+    # (output field, openFDA key) pairs read by _process_drug_data
+    _OPENFDA_FIELDS = (
+        ("brand_name", "brand_name"),
+        ("generic_name", "generic_name"),
+        ("manufacturer", "manufacturer_name"),
+        ("product_type", "product_type"),
+        ("route", "route"),
+        ("dosage_form", "dosage_form")
+    )
+    _LABEL_FIELDS = (
+        ("indications", "indications_and_usage"),
+        ("warnings", "warnings"),
+        ("adverse_reactions", "adverse_reactions"),
+        ("description", "description"),
+        ("clinical_pharmacology", "clinical_pharmacology"),
+        ("nonclinical_toxicology", "nonclinical_toxicology"),
+        ("clinical_studies", "clinical_studies"),
+        ("how_supplied", "how_supplied"),
+        ("storage_and_handling", "storage_and_handling"),
+        ("patient_counseling", "patient_counseling_information")
+    )
+    
+    def __init__(
+        self,
+        base_url: str = "https://api.fda.gov",
+        client: Optional[httpx.AsyncClient] = None
+    ):
         self.base_url = base_url
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = client or HTTP
     
+    @ttl_cache(ONE_WEEK)
     async def search_drugs(
         self,
         search_term: str,
@@ -26,25 +80,17 @@ class FDADrugAPI:
         Search FDA drug database
         """
         try:
-            params = {
-                "search": f"openfda.brand_name:{search_term} OR openfda.generic_name:{search_term}",
-                "limit": limit,
-                "skip": skip
-            }
+            url, params = _drug_search_url(self.base_url, search_term, limit, skip)
             
-            response = await self.client.get(f"{self.base_url}/drug/label.json", params=params)
-            response.raise_for_status()
+            response = await get_with_retry(self.client, url)
             
-            data = response.json()
+            data = orjson.loads(response.content)
             
             # Process drug data
-            processed_drugs = []
-            for drug in data.get("results", []):
-                drug_data = self._process_drug_data(drug)
-                processed_drugs.append(drug_data)
+            processed_drugs = await self._process_drugs(data.get("results", []))
             
             return {
-                "total_count": data.get("meta", {}).get("results", {}).get("total", 0),
+                "total_count": self._total_count(data),
                 "drugs": processed_drugs,
                 "search_params": params
             }
@@ -59,48 +105,52 @@ class FDADrugAPI:
         """
         openfda = drug.get("openfda", {})
         
-        return {
-            "brand_name": openfda.get("brand_name", [""])[0] if openfda.get("brand_name") else "",
-            "generic_name": openfda.get("generic_name", [""])[0] if openfda.get("generic_name") else "",
-            "manufacturer": openfda.get("manufacturer_name", [""])[0] if openfda.get("manufacturer_name") else "",
-            "product_type": openfda.get("product_type", [""])[0] if openfda.get("product_type") else "",
-            "route": openfda.get("route", [""])[0] if openfda.get("route") else "",
-            "dosage_form": openfda.get("dosage_form", [""])[0] if openfda.get("dosage_form") else "",
-            "active_ingredients": openfda.get("substance_name", []),
-            "indications": drug.get("indications_and_usage", [""])[0] if drug.get("indications_and_usage") else "",
-            "warnings": drug.get("warnings", [""])[0] if drug.get("warnings") else "",
-            "adverse_reactions": drug.get("adverse_reactions", [""])[0] if drug.get("adverse_reactions") else "",
-            "description": drug.get("description", [""])[0] if drug.get("description") else "",
-            "clinical_pharmacology": drug.get("clinical_pharmacology", [""])[0] if drug.get("clinical_pharmacology") else "",
-            "nonclinical_toxicology": drug.get("nonclinical_toxicology", [""])[0] if drug.get("nonclinical_toxicology") else "",
-            "clinical_studies": drug.get("clinical_studies", [""])[0] if drug.get("clinical_studies") else "",
-            "how_supplied": drug.get("how_supplied", [""])[0] if drug.get("how_supplied") else "",
-            "storage_and_handling": drug.get("storage_and_handling", [""])[0] if drug.get("storage_and_handling") else "",
-            "patient_counseling": drug.get("patient_counseling_information", [""])[0] if drug.get("patient_counseling_information") else ""
+        processed = {name: _first(openfda, key) for name, key in self._OPENFDA_FIELDS}
+        processed["active_ingredients"] = openfda.get("substance_name", [])
+        processed.update((name, _first(drug, key)) for name, key in self._LABEL_FIELDS)
+        return processed
+    
+    @staticmethod
+    def _total_count(data: Dict[str, Any]) -> int:
+        """meta.results.total of an openFDA response, 0 when absent"""
+        try:
+            return data["meta"]["results"]["total"]
+        except KeyError:
+            return 0
+    
+    def _process_all_drugs(self, drugs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self._process_drug_data(drug) for drug in drugs]
+    
+    async def _process_drugs(self, drugs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Normalize a page of label records, off the event loop for large pages
+        so concurrent API calls keep making progress
+        """
+        if len(drugs) > 50:
+            return await asyncio.to_thread(self._process_all_drugs, drugs)
+        return self._process_all_drugs(drugs)
+    
+    async def _search_labels(self, search: str, limit: int) -> Dict[str, Any]:
+        """Run a drug label search and return the decoded openFDA response"""
+        params = {
+            "search": search,
+            "limit": limit
         }
+        response = await get_with_retry(self.client, f"{self.base_url}/drug/label.json", params=params)
+        return orjson.loads(response.content)
     
+    @ttl_cache(ONE_WEEK)
     async def search_drugs_by_indication(self, indication: str, limit: int = 50) -> Dict[str, Any]:
         """
         Search drugs by indication
         """
         try:
-            params = {
-                "search": f"indications_and_usage:{indication}",
-                "limit": limit
-            }
-            
-            response = await self.client.get(f"{self.base_url}/drug/label.json", params=params)
-            response.raise_for_status()
+            data = await self._search_labels(f"indications_and_usage:{indication}", limit)
             
-            data = response.json()
-            
-            processed_drugs = []
-            for drug in data.get("results", []):
-                drug_data = self._process_drug_data(drug)
-                processed_drugs.append(drug_data)
+            processed_drugs = await self._process_drugs(data.get("results", []))
             
             return {
-                "total_count": data.get("meta", {}).get("results", {}).get("total", 0),
+                "total_count": self._total_count(data),
                 "drugs": processed_drugs,
                 "indication": indication
             }
@@ -109,31 +159,39 @@ class FDADrugAPI:
             logger.error(f"Error searching drugs by indication: {str(e)}")
             return {"error": str(e), "drugs": []}
     
+    @ttl_cache(ONE_WEEK)
     async def search_oncology_drugs(self, limit: int = 100) -> Dict[str, Any]:
         """
         Search for oncology-related drugs
         """
-        oncology_terms = ["cancer", "oncology", "tumor", "neoplasm", "carcinoma", "sarcoma", "lymphoma", "leukemia"]
-        search_query = " OR ".join([f"indications_and_usage:{term}" for term in oncology_terms])
-        
         try:
-            params = {
-                "search": search_query,
-                "limit": limit
-            }
-            
-            response = await self.client.get(f"{self.base_url}/drug/label.json", params=params)
-            response.raise_for_status()
+            # One query per term runs faster upstream than a single OR query
+            # and doesn't bias the page towards the first matching term
+            per_term = max(1, -(-limit // len(ONCOLOGY_TERMS)))
+            pages = await asyncio.gather(
+                *(self._search_labels(f"indications_and_usage:{term}", per_term) for term in ONCOLOGY_TERMS),
+                return_exceptions=True
+            )
+            succeeded = [page for page in pages if not isinstance(page, Exception)]
+            if not succeeded:
+                raise pages[0]
             
-            data = response.json()
+            # Labels matching several terms come back once per term
+            seen = set()
+            merged = []
+            for page in succeeded:
+                for drug in page.get("results", []):
+                    drug_id = _first(drug.get("openfda", {}), "application_number", None) or drug.get("id")
+                    if drug_id in seen:
+                        continue
+                    seen.add(drug_id)
+                    merged.append(drug)
             
-            processed_drugs = []
-            for drug in data.get("results", []):
-                drug_data = self._process_drug_data(drug)
-                processed_drugs.append(drug_data)
+            processed_drugs = await self._process_drugs(merged[:limit])
             
             return {
-                "total_count": data.get("meta", {}).get("results", {}).get("total", 0),
+                # Term totals overlap, so the largest is the best lower bound
+                "total_count": max(self._total_count(page) for page in succeeded),
                 "drugs": processed_drugs,
                 "search_type": "oncology"
             }
@@ -142,6 +200,7 @@ class FDADrugAPI:
             logger.error(f"Error searching oncology drugs: {str(e)}")
             return {"error": str(e), "drugs": []}
     
+    @ttl_cache(ONE_DAY)
     async def get_drug_events(
         self,
         drug_name: str,
@@ -156,10 +215,9 @@ class FDADrugAPI:
                 "limit": limit
             }
             
-            response = await self.client.get(f"{self.base_url}/drug/event.json", params=params)
-            response.raise_for_status()
+            response = await get_with_retry(self.client, f"{self.base_url}/drug/event.json", params=params)
             
-            data = response.json()
+            data = orjson.loads(response.content)
             
             events = []
             for event in data.get("results", []):
@@ -175,7 +233,7 @@ class FDADrugAPI:
                 events.append(event_data)
             
             return {
-                "total_count": data.get("meta", {}).get("results", {}).get("total", 0),
+                "total_count": self._total_count(data),
                 "events": events,
                 "drug_name": drug_name
             }
@@ -184,6 +242,7 @@ class FDADrugAPI:
             logger.error(f"Error getting drug events: {str(e)}")
             return {"error": str(e), "events": []}
     
+    @ttl_cache(ONE_DAY)
     async def get_drug_recalls(
         self,
         drug_name: Optional[str] = None,
@@ -198,10 +257,9 @@ class FDADrugAPI:
             if drug_name:
                 params["search"] = f"product_description:{drug_name}"
             
-            response = await self.client.get(f"{self.base_url}/drug/enforcement.json", params=params)
-            response.raise_for_status()
+            response = await get_with_retry(self.client, f"{self.base_url}/drug/enforcement.json", params=params)
             
-            data = response.json()
+            data = orjson.loads(response.content)
             
             recalls = []
             for recall in data.get("results", []):
@@ -218,7 +276,7 @@ class FDADrugAPI:
                 recalls.append(recall_data)
             
             return {
-                "total_count": data.get("meta", {}).get("results", {}).get("total", 0),
+                "total_count": self._total_count(data),
                 "recalls": recalls,
                 "drug_name": drug_name
             }
@@ -226,7 +284,3 @@ class FDADrugAPI:
         except Exception as e:
             logger.error(f"Error getting drug recalls: {str(e)}")
             return {"error": str(e), "recalls": []}
-    
-    async def close(self):
-        """Close the HTTP client"""
-        await self.client.aclose()
@@ -4,17 +4,37 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import json
 import logging
+from operator import itemgetter
+import orjson
+from lxml import etree
+
+from app.core.http import HTTP
+from .rate_limit import get_with_retry
+from .cache import cached_get
 
 logger = logging.getLogger(__name__)
 
+_SUMMARY_FIELDS = itemgetter("uid", "title", "fulljournalname", "source", "sortpubdate", "authors")
+
+# PMIDs per esummary/efetch request; larger result sets are split and fetched concurrently
+EUTILS_BATCH_SIZE = 200
+
+# Query templates for the canned searches; only the quoted term varies per call
+_PUBMED_DRUG_TMPL = '"{}"[Title/Abstract] AND ("cancer"[Title/Abstract] OR "oncology"[Title/Abstract])'
+_PUBMED_AREA_TMPL = '"{}"[Title/Abstract] AND ("women"[Title/Abstract] OR "female"[Title/Abstract])'
+
 class PubMedAPI:
     """
     Integration with PubMed API for scientific literature
     """
     
-    def __init__(self, base_url: str = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"):
+    def __init__(
+        self,
+        base_url: str = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils",
+        client: Optional[httpx.AsyncClient] = None
+    ):
         self.base_url = base_url
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = client or HTTP
     
     async def search_articles(
         self,
@@ -22,10 +42,12 @@ class PubMedAPI:
         max_results: int = 100,
         sort: str = "relevance",
         mindate: Optional[str] = None,
-        maxdate: Optional[str] = None
+        maxdate: Optional[str] = None,
+        include_abstracts: bool = False
     ) -> Dict[str, Any]:
         """
-        Search PubMed articles
+        Search PubMed articles. Abstracts and keywords cost an extra efetch
+        round, so they are only filled in when include_abstracts is set.
         """
         try:
             # First, search for article IDs
@@ -42,41 +64,19 @@ class PubMedAPI:
             if maxdate:
                 search_params["maxdate"] = maxdate
             
-            search_response = await self.client.get(
+            search_content = await cached_get(
+                self.client,
                 f"{self.base_url}/esearch.fcgi",
                 params=search_params
             )
-            search_response.raise_for_status()
             
-            search_data = search_response.json()
+            search_data = orjson.loads(search_content)
             pmids = search_data.get("esearchresult", {}).get("idlist", [])
             
             if not pmids:
                 return {"articles": [], "total_count": 0}
             
-            # Get detailed article information
-            fetch_params = {
-                "db": "pubmed",
-                "id": ",".join(pmids),
-                "retmode": "json",
-                "rettype": "abstract"
-            }
-            
-            fetch_response = await self.client.get(
-                f"{self.base_url}/efetch.fcgi",
-                params=fetch_params
-            )
-            fetch_response.raise_for_status()
-            
-            fetch_data = fetch_response.json()
-            
-            # Process articles
-            processed_articles = []
-            articles = fetch_data.get("PubmedArticle", [])
-            
-            for article in articles:
-                article_data = self._process_article_data(article)
-                processed_articles.append(article_data)
+            processed_articles = await self._fetch_articles(pmids, include_abstracts)
             
             return {
                 "total_count": search_data.get("esearchresult", {}).get("count", 0),
@@ -88,76 +88,125 @@ class PubMedAPI:
             logger.error(f"Error searching PubMed articles: {str(e)}")
             return {"error": str(e), "articles": []}
     
-    def _process_article_data(self, article: Dict[str, Any]) -> Dict[str, Any]:
+    async def _fetch_articles(self, pmids: List[str], include_abstracts: bool) -> List[Dict[str, Any]]:
+        """
+        ESummary (JSON) for the listed PMIDs, plus efetch (XML) for abstracts
+        when asked; all batches are fetched concurrently
+        """
+        batches = [",".join(pmids[i:i + EUTILS_BATCH_SIZE]) for i in range(0, len(pmids), EUTILS_BATCH_SIZE)]
+        summary_calls = [
+            cached_get(
+                self.client,
+                f"{self.base_url}/esummary.fcgi",
+                params={"db": "pubmed", "id": batch, "retmode": "json"}
+            )
+            for batch in batches
+        ]
+        abstract_calls = [self._fetch_abstracts(batch) for batch in batches] if include_abstracts else []
+        
+        responses = await asyncio.gather(*summary_calls, *abstract_calls)
+        
+        extras = {}
+        for batch_extras in responses[len(batches):]:
+            extras.update(batch_extras)
+        
+        # Process articles
+        processed_articles = []
+        for content in responses[:len(batches)]:
+            result = orjson.loads(content).get("result", {})
+            for pmid in result.get("uids", []):
+                summary = result.get(pmid, {})
+                if "error" in summary:
+                    continue
+                processed_articles.append(self._process_article_data(summary, extras.get(pmid)))
+        
+        return processed_articles
+    
+    async def _fetch_abstracts(self, pmids: str) -> Dict[str, Dict[str, Any]]:
         """
-        Process raw article data into standardized format
+        Abstract text and keywords per PMID from PubMed efetch XML. The body
+        is parsed as it streams in and each article is freed once read, so
+        a large batch is never held in memory whole.
         """
-        medline_citation = article.get("MedlineCitation", {})
-        article_data = medline_citation.get("Article", {})
-        pmid = medline_citation.get("PMID", {}).get("#text", "")
+        extras = {}
+        parser = etree.XMLPullParser(events=("end",), tag="PubmedArticle", resolve_entities=False)
         
-        # Extract authors
-        authors = []
-        author_list = article_data.get("AuthorList", {}).get("Author", [])
-        if isinstance(author_list, list):
-            for author in author_list:
-                last_name = author.get("LastName", "")
-                first_name = author.get("ForeName", "")
-                if last_name and first_name:
-                    authors.append(f"{last_name}, {first_name}")
+        response = await get_with_retry(
+            self.client,
+            f"{self.base_url}/efetch.fcgi",
+            params={"db": "pubmed", "id": pmids, "retmode": "xml", "rettype": "abstract"},
+            stream=True
+        )
+        try:
+            async for chunk in response.aiter_bytes():
+                parser.feed(chunk)
+                for _, article in parser.read_events():
+                    pmid = article.findtext("MedlineCitation/PMID", "")
+                    extras[pmid] = {
+                        "abstract": "\n".join("".join(text.itertext()) for text in article.iterfind(".//Abstract/AbstractText")),
+                        "keywords": ["".join(keyword.itertext()) for keyword in article.iterfind(".//KeywordList/Keyword")]
+                    }
+                    article.clear()
+        finally:
+            await response.aclose()
+        parser.close()
         
-        # Extract journal information
-        journal = article_data.get("Journal", {})
-        journal_title = journal.get("Title", "")
-        journal_issue = journal.get("JournalIssue", {})
-        pub_date = journal_issue.get("PubDate", {})
+        return extras
+    
+    def _process_article_data(self, summary: Dict[str, Any], extras: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Process an ESummary record (plus efetch extras) into standardized format
+        """
+        extras = extras or {}
         
-        # Extract publication date
-        year = pub_date.get("Year", "")
-        month = pub_date.get("Month", "")
-        day = pub_date.get("Day", "")
+        # ESummary records nearly always carry every one of these fields
+        try:
+            pmid, title, journal, source, sortpubdate, author_list = _SUMMARY_FIELDS(summary)
+        except KeyError:
+            get = summary.get
+            pmid, title, journal, source, sortpubdate, author_list = (
+                get("uid", ""), get("title", ""), get("fulljournalname", ""),
+                get("source", ""), get("sortpubdate", ""), get("authors", [])
+            )
         
-        publication_date = f"{year}-{month}-{day}" if year else ""
+        # ESummary lists collective/corporate authors too; keep people only
+        authors = [
+            author.get("name", "")
+            for author in author_list
+            if author.get("authtype") == "Author"
+        ]
         
-        # Extract keywords
-        keywords = []
-        keyword_list = medline_citation.get("KeywordList", {}).get("Keyword", [])
-        if isinstance(keyword_list, list):
-            keywords = [kw.get("#text", "") if isinstance(kw, dict) else kw for kw in keyword_list]
+        # sortpubdate is "YYYY/MM/DD HH:MM"
+        publication_date = sortpubdate[:10].replace("/", "-")
         
         return {
             "pmid": pmid,
-            "title": article_data.get("ArticleTitle", ""),
-            "abstract": article_data.get("Abstract", {}).get("AbstractText", ""),
+            "title": title,
+            "abstract": extras.get("abstract", ""),
             "authors": authors,
-            "journal": journal_title,
+            "journal": journal or source,
             "publication_date": publication_date,
-            "keywords": keywords,
-            "doi": self._extract_doi(article_data),
+            "keywords": extras.get("keywords", []),
+            "doi": next(
+                (article_id.get("value", "") for article_id in summary.get("articleids", [])
+                 if isinstance(article_id, dict) and article_id.get("idtype") == "doi"),
+                None
+            ),
             "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
         }
     
-    def _extract_doi(self, article_data: Dict[str, Any]) -> Optional[str]:
-        """Extract DOI from article data"""
-        elocation_ids = article_data.get("ELocationID", [])
-        if isinstance(elocation_ids, list):
-            for eloc in elocation_ids:
-                if eloc.get("@EIdType") == "doi":
-                    return eloc.get("#text", "")
-        return None
-    
     async def search_by_drug(self, drug_name: str, max_results: int = 50) -> Dict[str, Any]:
         """
         Search articles related to a specific drug
         """
-        query = f'"{drug_name}"[Title/Abstract] AND ("cancer"[Title/Abstract] OR "oncology"[Title/Abstract])'
+        query = _PUBMED_DRUG_TMPL.format(drug_name)
         return await self.search_articles(query, max_results=max_results)
     
     async def search_by_therapeutic_area(self, therapeutic_area: str, max_results: int = 50) -> Dict[str, Any]:
         """
         Search articles by therapeutic area
         """
-        query = f'"{therapeutic_area}"[Title/Abstract] AND ("women"[Title/Abstract] OR "female"[Title/Abstract])'
+        query = _PUBMED_AREA_TMPL.format(therapeutic_area)
         return await self.search_articles(query, max_results=max_results)
     
     async def search_recent_articles(self, query: str, days: int = 30, max_results: int = 50) -> Dict[str, Any]:
@@ -182,31 +231,13 @@ class PubMedAPI:
         Get detailed information for a specific article
         """
         try:
-            params = {
-                "db": "pubmed",
-                "id": pmid,
-                "retmode": "json",
-                "rettype": "abstract"
-            }
-            
-            response = await self.client.get(
-                f"{self.base_url}/efetch.fcgi",
-                params=params
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            articles = data.get("PubmedArticle", [])
+            articles = await self._fetch_articles([pmid], include_abstracts=True)
             
             if articles:
-                return self._process_article_data(articles[0])
+                return articles[0]
             else:
                 return {"error": "Article not found"}
                 
         except Exception as e:
             logger.error(f"Error getting article details for PMID {pmid}: {str(e)}")
             return {"error": str(e)}
-    
-    async def close(self):
-        """Close the HTTP client"""
-        await self.client.aclose()
@@ -0,0 +1,117 @@
+import asyncio
+import random
+import time
+import logging
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Requests per second each upstream tolerates without an API key
+# (openFDA documents 240/min, NCBI E-utilities 3/s)
+HOST_RATES = {
+    "api.fda.gov": 4.0,
+    "eutils.ncbi.nlm.nih.gov": 3.0,
+}
+DEFAULT_RATE = 5.0
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket that halves its rate when the upstream answers 429 and
+    creeps back towards the configured rate as requests succeed.
+    """
+
+    def __init__(self, rate: float, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttled(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+
+def get_limiter(url: str) -> AdaptiveRateLimiter:
+    """Return the process-wide limiter for the URL's host."""
+    host = urlsplit(url).hostname or ""
+    limiter = _limiters.get(host)
+    if limiter is None:
+        limiter = _limiters[host] = AdaptiveRateLimiter(HOST_RATES.get(host, DEFAULT_RATE))
+    return limiter
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if value and value.isdigit():
+        return float(value)
+    return None
+
+
+async def get_with_retry(
+    client: httpx.AsyncClient,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    max_attempts: int = 5,
+    base_backoff: float = 0.5,
+    max_backoff: float = 30.0,
+    stream: bool = False,
+    attempt_timeout: float = 8.0
+) -> httpx.Response:
+    """
+    GET through the host's rate limiter, retrying throttling, 5xx and
+    timeouts with jittered exponential backoff. Raises the last error once
+    attempts run out; any other HTTP error is raised straight away.
+    Each attempt gets `attempt_timeout` seconds of wall clock on top of the
+    client's socket timeouts.
+    With stream=True the body is left unread and the caller must aclose()
+    the returned response.
+    """
+    limiter = get_limiter(url)
+    for attempt in range(max_attempts):
+        await limiter.acquire()
+        delay = min(max_backoff, base_backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+        try:
+            async with asyncio.timeout(attempt_timeout):
+                response = await client.send(client.build_request("GET", url, params=params), stream=stream)
+            if stream and response.is_error:
+                await response.aclose()
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in RETRY_STATUS_CODES or attempt == max_attempts - 1:
+                raise
+            if e.response.status_code == 429:
+                limiter.on_throttled()
+                delay = _retry_after(e.response) or delay
+        except (httpx.TimeoutException, TimeoutError):
+            if attempt == max_attempts - 1:
+                raise
+        else:
+            limiter.on_success()
+            return response
+
+        logger.warning(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1} of {max_attempts})")
+        await asyncio.sleep(delay)
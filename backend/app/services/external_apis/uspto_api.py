@@ -1,20 +1,45 @@
 import httpx
 import asyncio
-from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import date
+from dateutil.relativedelta import relativedelta
+import functools
 import json
 import logging
+import time
+import orjson
+
+from app.core.http import HTTP
+from .cache import cached_get
 
 logger = logging.getLogger(__name__)
 
+# Query and link templates; only the interpolated values vary per call
+_USPTO_DRUG_TMPL = '"{0}" OR "{1}" OR "{2}"'
+_USPTO_AREA_TMPL = '"{}" OR "cancer" OR "oncology"'
+_PATENT_URL_TMPL = "https://appft.uspto.gov/netacgi/nph-Parser?Sect1=PTO1&Sect2=HITOFF&d=PG01&p=1&u=%2Fnetahtml%2FPTO%2Fsrchnum.html&r=1&f=G&l=50&s1={}"
+
+@functools.lru_cache(maxsize=16)
+def _date_window(minute_bucket: int, years_ahead: int) -> Tuple[str, str]:
+    """
+    Today and the same calendar day `years_ahead` years on, as YYYY-MM-DD.
+    Callers pass the current minute so the strings are rebuilt at most once a minute.
+    """
+    today = date.today()
+    return today.isoformat(), (today + relativedelta(years=years_ahead)).isoformat()
+
 class USPTOAPI:
     """
     Integration with USPTO Patent API
     """
     
-    def __init__(self, base_url: str = "https://developer.uspto.gov/ibd-api/v1"):
+    def __init__(
+        self,
+        base_url: str = "https://developer.uspto.gov/ibd-api/v1",
+        client: Optional[httpx.AsyncClient] = None
+    ):
         self.base_url = base_url
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = client or HTTP
     
     async def search_patents(
         self,
@@ -38,10 +63,7 @@ class USPTOAPI:
             if end_date:
                 params["fq"] = f"applicationDate:[* TO {end_date}]"
             
-            response = await self.client.get(f"{self.base_url}/patent/application", params=params)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = orjson.loads(await cached_get(self.client, f"{self.base_url}/patent/application", params=params))
             
             # Process patent data
             processed_patents = []
@@ -63,32 +85,35 @@ class USPTOAPI:
         """
         Process raw patent data into standardized format
         """
+        get = patent.get
+        patent_number = get("applicationNumberText", "")
+        
         return {
-            "patent_number": patent.get("applicationNumberText", ""),
-            "title": patent.get("inventionTitle", ""),
-            "inventors": patent.get("inventorName", []),
-            "assignee": patent.get("assigneeEntityName", ""),
-            "filing_date": patent.get("applicationDate", ""),
-            "issue_date": patent.get("patentIssueDate", ""),
-            "abstract": patent.get("abstractText", ""),
-            "claims": patent.get("claimText", ""),
-            "classification": patent.get("primaryClassification", ""),
-            "status": patent.get("applicationStatus", ""),
-            "url": f"https://appft.uspto.gov/netacgi/nph-Parser?Sect1=PTO1&Sect2=HITOFF&d=PG01&p=1&u=%2Fnetahtml%2FPTO%2Fsrchnum.html&r=1&f=G&l=50&s1={patent.get('applicationNumberText', '')}"
+            "patent_number": patent_number,
+            "title": get("inventionTitle", ""),
+            "inventors": get("inventorName", []),
+            "assignee": get("assigneeEntityName", ""),
+            "filing_date": get("applicationDate", ""),
+            "issue_date": get("patentIssueDate", ""),
+            "abstract": get("abstractText", ""),
+            "claims": get("claimText", ""),
+            "classification": get("primaryClassification", ""),
+            "status": get("applicationStatus", ""),
+            "url": _PATENT_URL_TMPL.format(patent_number)
         }
     
     async def search_patents_by_drug(self, drug_name: str, limit: int = 50) -> Dict[str, Any]:
         """
         Search patents related to a specific drug
         """
-        query = f'"{drug_name}" OR "{drug_name.lower()}" OR "{drug_name.upper()}"'
+        query = _USPTO_DRUG_TMPL.format(drug_name, drug_name.lower(), drug_name.upper())
         return await self.search_patents(query, limit=limit)
     
     async def search_patents_by_therapeutic_area(self, therapeutic_area: str, limit: int = 50) -> Dict[str, Any]:
         """
         Search patents by therapeutic area
         """
-        query = f'"{therapeutic_area}" OR "cancer" OR "oncology"'
+        query = _USPTO_AREA_TMPL.format(therapeutic_area)
         return await self.search_patents(query, limit=limit)
     
     async def get_patent_details(self, patent_number: str) -> Dict[str, Any]:
@@ -96,10 +121,7 @@ class USPTOAPI:
         Get detailed information for a specific patent
         """
         try:
-            response = await self.client.get(f"{self.base_url}/patent/application/{patent_number}")
-            response.raise_for_status()
-            
-            data = response.json()
+            data = orjson.loads(await cached_get(self.client, f"{self.base_url}/patent/application/{patent_number}"))
             return self._process_patent_data(data)
             
         except Exception as e:
@@ -115,8 +137,7 @@ class USPTOAPI:
         Get patents expiring in the next N years
         """
         try:
-            current_date = datetime.now()
-            future_date = current_date + timedelta(days=years_ahead * 365)
+            start_date, end_date = _date_window(int(time.time() // 60), years_ahead)
             
             query = "patent"
             if therapeutic_area:
@@ -124,15 +145,11 @@ class USPTOAPI:
             
             return await self.search_patents(
                 query=query,
-                start_date=current_date.strftime("%Y-%m-%d"),
-                end_date=future_date.strftime("%Y-%m-%d"),
+                start_date=start_date,
+                end_date=end_date,
                 limit=200
             )
             
         except Exception as e:
             logger.error(f"Error getting expiring patents: {str(e)}")
             return {"error": str(e), "patents": []}
-    
-    async def close(self):
-        """Close the HTTP client"""
-        await self.client.aclose()
@@ -1,3 +1,6 @@
+import orjson
+
+from app.core.batching import AsyncBatcher
 from app.models.schemas import ResearchState, Evidence
 
 try:
@@ -6,19 +9,47 @@ try:
 except ImportError:
     VERTEX_AI_AVAILABLE = False
 
-def literature_review_scout(state: ResearchState) -> ResearchState:
+
+class LitReviewBatcher(AsyncBatcher):
+    """Answers concurrent literature prompts with one multi-part Gemini call"""
+
+    async def process_batch(self, topics):
+        model = get_gemini_model()
+        if len(topics) == 1:
+            response = await model.generate_content_async(_summary_prompt(topics[0]))
+            return [response.text.strip()]
+
+        parts = [
+            "You are an expert medical researcher. For each numbered topic below, provide a concise summary (under 40 words) of a key scientific finding or recent study. "
+            f"Respond with only a JSON array of exactly {len(topics)} strings, in the same order as the topics."
+        ]
+        parts.extend(f"{i}. {topic}" for i, topic in enumerate(topics, 1))
+        response = await model.generate_content_async(parts)
+
+        # Imported here: master_agent imports the research pipeline, which imports this module
+        from app.services.master_agent import _FENCE_RE
+        m = _FENCE_RE.search(response.text)
+        payload = m.group(1) if m else response.text
+        return [str(summary).strip() for summary in orjson.loads(payload)]
+
+
+def _summary_prompt(topic: str) -> str:
+    return f"""
+            You are an expert medical researcher. Provide a concise summary (under 40 words) of a key scientific finding or recent study regarding: "{topic}".
+            """
+
+
+_batcher = LitReviewBatcher(max_batch_size=16, max_queue_time=0.05)
+
+
+async def literature_review_scout(state: ResearchState) -> ResearchState:
     state.logs.append(f"Literature Review Scout: Analyzing literature for '{state.biological_focus}'")
 
     finding = "Recent meta-analysis confirms efficacy in triple-negative breast cancer"
 
     if VERTEX_AI_AVAILABLE:
         try:
-            model = get_gemini_model()
-            prompt = f"""
-            You are an expert medical researcher. Provide a concise summary (under 40 words) of a key scientific finding or recent study regarding: "{state.biological_focus}".
-            """
-            response = model.generate_content(prompt)
-            finding = response.text.strip()
+            finding = await _batcher.submit(state.biological_focus)
         except Exception as e:
             state.logs.append(f"AI Error: {str(e)}")
 
@@ -29,4 +60,4 @@ def literature_review_scout(state: ResearchState) -> ResearchState:
     )
 
     state.evidence.append(evidence)
-    return state
\ No newline at end of file
+    return state
@@ -1,8 +1,12 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from fastapi import BackgroundTasks
-import json
+from fastapi import BackgroundTasks, Request
 import asyncio
+import orjson
+import re
+from collections import OrderedDict
+from itertools import islice
+import ahocorasick
 from datetime import datetime
 
 # Import worker agents
@@ -18,6 +22,7 @@ from app.services.worker_agents.regulatory_compliance_agent import RegulatoryCom
 from app.services.worker_agents.deep_research_agent import DeepResearchAgent
 
 # Import models
+from app.core.database import SessionLocal
 from app.models.models import ResearchSession, ChatMessage, AgentResult
 
 # Import Vertex AI
@@ -27,6 +32,73 @@ try:
 except ImportError:
     VERTEX_AI_AVAILABLE = False
 
+ROUTE_CACHE_SIZE = 4096
+_NON_WORD_RE = re.compile(r"\W+")
+# Body of a markdown code fence, with or without a json language tag
+_FENCE_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)```")
+
+def _normalize_query(query: str) -> str:
+    """Lower-case and collapse punctuation/whitespace so trivially different queries share a cache entry"""
+    return _NON_WORD_RE.sub(" ", query.lower()).strip()
+
+# Routing keywords per agent, in the order agents are reported
+_ROUTING_KEYWORDS = {
+    "iqvia": ("market", "sales", "revenue", "competitor", "share"),
+    "patent": ("patent", "ip", "intellectual property", "expiry", "expiration"),
+    "clinical_trials": ("trial", "clinical", "pipeline", "phase", "study"),
+    "exim": ("trade", "export", "import", "supply", "sourcing", "api"),
+    "web_intelligence": ("news", "publication", "article", "journal", "regulatory", "fda", "ema"),
+    "internal_knowledge": ("internal", "document", "report", "past project"),
+    "report_generator": ("generate report", "pdf", "excel", "download"),
+    "drug_interaction": ("interaction", "contraindication", "combine", "safe to take", "side effect"),
+    "regulatory_compliance": ("fda", "guideline", "compliance", "regulation", "approval", "ind", "nda", "bla"),
+    "deep_research": ("deep research", "pipeline", "genomic", "rrf", "trust score", "sequence")
+}
+
+def _build_keyword_automaton() -> ahocorasick.Automaton:
+    """Aho-Corasick automaton mapping each keyword to every agent it routes to"""
+    agents_by_keyword = {}
+    for agent_key, keywords in _ROUTING_KEYWORDS.items():
+        for keyword in keywords:
+            agents_by_keyword.setdefault(keyword, []).append(agent_key)
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, agent_keys in agents_by_keyword.items():
+        automaton.add_word(keyword, (keyword, tuple(agent_keys)))
+    automaton.make_automaton()
+    return automaton
+
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+def _keyword_route(normalized: str) -> Tuple[tuple, int]:
+    """
+    Agents whose routing keywords appear as whole words in the normalized query,
+    found in one scan, plus the number of distinct keywords that matched.
+    Hits inside longer words ("ip" in "lipid", "api" in "therapies") are ignored.
+    """
+    matched_keywords = set()
+    matched_agents = set()
+    for end, (keyword, agent_keys) in _KEYWORD_AUTOMATON.iter(normalized):
+        start = end - len(keyword) + 1
+        if (start == 0 or normalized[start - 1] == " ") and (end + 1 == len(normalized) or normalized[end + 1] == " "):
+            matched_keywords.add(keyword)
+            matched_agents.update(agent_keys)
+    agents = tuple(agent_key for agent_key in _ROUTING_KEYWORDS if agent_key in matched_agents)
+    return agents, len(matched_keywords)
+
+# Most list items / dict entries kept per level when building the synthesis context
+_CONTEXT_MAX_ITEMS = 20
+
+def _truncate(value: Any, max_chars: int) -> Any:
+    """Copy of `value` with strings cut to max_chars and lists/dicts to _CONTEXT_MAX_ITEMS entries"""
+    if isinstance(value, str):
+        return value[:max_chars]
+    if isinstance(value, dict):
+        return {k: _truncate(v, max_chars) for k, v in islice(value.items(), _CONTEXT_MAX_ITEMS)}
+    if isinstance(value, (list, tuple)):
+        return [_truncate(v, max_chars) for v in value[:_CONTEXT_MAX_ITEMS]]
+    return value
+
 class MasterAgent:
     """
     Master Agent that orchestrates the research process by delegating to worker agents
@@ -46,6 +118,9 @@ class MasterAgent:
             "deep_research": DeepResearchAgent()
         }
         
+        # normalized query -> agent keys, least recently used first
+        self._route_cache = OrderedDict()
+        
         self.model = None
         if VERTEX_AI_AVAILABLE:
             try:
@@ -63,52 +138,63 @@ class MasterAgent:
         """
         Process a user query by coordinating worker agents
         """
-        # 1. Create or retrieve session if needed
-        if not session_id:
-            session = ResearchSession(
-                title=self._generate_title(query),
-                query=query,
-                user_id=1,  # Default user
-                status="active"
-            )
-            db.add(session)
-            db.commit()
-            db.refresh(session)
-            session_id = session.id
+        # 1. Determine intent and delegate
+        selected_agents = await self._route_query(query)
         
-        # 2. Save user message
-        user_msg = ChatMessage(
-            session_id=session_id,
-            role="user",
-            content=query
+        # 2. Execute agents concurrently, each with its own DB session for reads
+        agent_keys = [agent_key for agent_key in dict.fromkeys(selected_agents) if agent_key in self.agents]
+        results = await asyncio.gather(
+            *(self._execute_agent(self.agents[agent_key], query, SessionLocal()) for agent_key in agent_keys),
+            return_exceptions=True
         )
-        db.add(user_msg)
-        db.commit()
-
-        # 3. Determine intent and delegate
-        selected_agents = await self._route_query(query)
         
-        # 4. Execute agents (sequentially to be safe with DB session)
         agent_results = {}
+        records = []
+        for agent_key, result in zip(agent_keys, results):
+            if isinstance(result, Exception):
+                result = {"agent": agent_key, "error": str(result)}
+            else:
+                result, record = result
+                records.append(record)
+            agent_results[agent_key] = result
         
-        for agent_key in selected_agents:
-            if agent_key in self.agents:
-                agent = self.agents[agent_key]
-                result = await self._execute_agent(agent, query, db, session_id)
-                agent_results[agent_key] = result
-        
-        # 5. Synthesize response
+        # 3. Synthesize response
         final_response = await self._synthesize_response(query, agent_results)
         
-        # 6. Save assistant message
-        asst_msg = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=final_response,
-            message_metadata={"agent_results": list(agent_results.keys())}
-        )
-        db.add(asst_msg)
-        db.commit()
+        # 4. Persist the session, both messages and the agent results in one transaction,
+        # opened only after the slow LLM and agent calls have finished
+        try:
+            if not session_id:
+                session = ResearchSession(
+                    title=self._generate_title(query),
+                    query=query,
+                    user_id=1,  # Default user
+                    status="active"
+                )
+                db.add(session)
+                db.flush()
+                session_id = session.id
+            
+            for record in records:
+                record.session_id = session_id
+            db.add_all(records)
+            db.add_all([
+                ChatMessage(
+                    session_id=session_id,
+                    role="user",
+                    content=query
+                ),
+                ChatMessage(
+                    session_id=session_id,
+                    role="assistant",
+                    content=final_response,
+                    message_metadata={"agent_results": list(agent_results.keys())}
+                )
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
 
         return {
             "response": final_response,
@@ -127,7 +213,20 @@ class MasterAgent:
     async def _route_query(self, query: str) -> List[str]:
         """
         Determine which agents to use based on the query.
+        Repeat queries are answered from a routing cache, and queries where at
+        least two distinct keywords point at two or more agents skip the LLM.
         """
+        normalized = _normalize_query(query)
+        cached = self._route_cache.get(normalized)
+        if cached is not None:
+            self._route_cache.move_to_end(normalized)
+            return list(cached)
+        
+        keyword_agents, keyword_count = _keyword_route(normalized)
+        if len(keyword_agents) >= 2 and keyword_count >= 2:
+            self._cache_route(normalized, keyword_agents)
+            return list(keyword_agents)
+        
         # Use LLM for routing if available
         if self.model:
             try:
@@ -151,82 +250,58 @@ class MasterAgent:
                 Return ONLY a JSON list of agent keys (e.g., ["iqvia", "patent"]).
                 """
                 response = self.model.generate_content(prompt)
-                text_response = response.text.strip()
+                text_response = response.text
                 # Clean up markdown code blocks if present
-                if "```" in text_response:
-                    text_response = text_response.split("```")[1].replace("json", "").strip()
+                m = _FENCE_RE.search(text_response)
+                payload = m.group(1) if m else text_response
                 
-                agents = json.loads(text_response)
+                agents = orjson.loads(payload)
                 if isinstance(agents, list) and all(isinstance(a, str) for a in agents):
                     # Filter to valid agents
                     valid_agents = [a for a in agents if a in self.agents]
                     if valid_agents:
+                        self._cache_route(normalized, valid_agents)
                         return valid_agents
             except Exception as e:
                 print(f"Routing error: {e}")
         
         # Fallback: Keyword matching
-        query_lower = query.lower()
-        selected = []
-        
-        if any(w in query_lower for w in ["market", "sales", "revenue", "competitor", "share"]):
-            selected.append("iqvia")
-        if any(w in query_lower for w in ["patent", "ip", "intellectual property", "expiry", "expiration"]):
-            selected.append("patent")
-        if any(w in query_lower for w in ["trial", "clinical", "pipeline", "phase", "study"]):
-            selected.append("clinical_trials")
-        if any(w in query_lower for w in ["trade", "export", "import", "supply", "sourcing", "api"]):
-            selected.append("exim")
-        if any(w in query_lower for w in ["news", "publication", "article", "journal", "regulatory", "fda", "ema"]):
-            selected.append("web_intelligence")
-        if any(w in query_lower for w in ["internal", "document", "report", "past project"]):
-            selected.append("internal_knowledge")
-        if any(w in query_lower for w in ["generate report", "pdf", "excel", "download"]):
-            selected.append("report_generator")
-        if any(w in query_lower for w in ["interaction", "contraindication", "combine", "safe to take", "side effect"]):
-            selected.append("drug_interaction")
-        if any(w in query_lower for w in ["fda", "guideline", "compliance", "regulation", "approval", "ind", "nda", "bla"]):
-            selected.append("regulatory_compliance")
-        if any(w in query_lower for w in ["deep research", "pipeline", "genomic", "rrf", "trust score", "sequence"]):
-            selected.append("deep_research")
-            
-        # Default
-        if not selected:
-            selected = ["web_intelligence", "internal_knowledge"]
-            
-        return list(set(selected))
+        return list(keyword_agents) or ["web_intelligence", "internal_knowledge"]
 
-    async def _execute_agent(self, agent, query: str, db: Session, session_id: int) -> Dict[str, Any]:
-        """Execute a single agent and save results"""
+    def _cache_route(self, normalized: str, agents):
+        """Remember a routing decision, evicting the least recently used past ROUTE_CACHE_SIZE"""
+        self._route_cache[normalized] = tuple(agents)
+        if len(self._route_cache) > ROUTE_CACHE_SIZE:
+            self._route_cache.popitem(last=False)
+
+    async def _execute_agent(self, agent, query: str, db: Session) -> Tuple[Dict[str, Any], AgentResult]:
+        """
+        Execute a single agent and build its AgentResult row for the caller to save;
+        `db` is the agent's own session and is closed here
+        """
         try:
             # Execute agent logic
             result = await agent.process_query(query, db)
-            
-            # Save result to DB
-            agent_result_record = AgentResult(
-                session_id=session_id,
+            record = AgentResult(
                 agent_type=agent.name,
                 query=query,
                 result_data=result,
                 status="completed"
             )
-            db.add(agent_result_record)
-            db.commit()
-            
-            return result
         except Exception as e:
             # Log error
-            error_record = AgentResult(
-                session_id=session_id,
+            result = {"agent": agent.name, "error": str(e)}
+            record = AgentResult(
                 agent_type=agent.name,
                 query=query,
                 result_data={},
                 status="failed",
                 error_message=str(e)
             )
-            db.add(error_record)
-            db.commit()
-            return {"agent": agent.name, "error": str(e)}
+        finally:
+            db.close()
+        
+        return result, record
 
     async def _synthesize_response(self, query: str, agent_results: Dict[str, Any]) -> str:
         """
@@ -235,9 +310,10 @@ class MasterAgent:
         # Use LLM for synthesis if available
         if self.model:
             try:
-                # Prepare context (truncate if too large)
-                context_data = {k: v.get("data", v) for k, v in agent_results.items()}
-                context_str = json.dumps(context_data, default=str)[:30000] # Limit context size
+                # Prepare context; each agent's data is capped before encoding so
+                # large results aren't serialized in full only to be cut off
+                context_data = {k: _truncate(v.get("data", v), 3000) for k, v in agent_results.items()}
+                context_str = orjson.dumps(context_data, default=str, option=orjson.OPT_NON_STR_KEYS).decode()[:30000] # Limit context size
                 
                 prompt = f"""
                 You are the Master Agent for PharmaShe.
@@ -266,4 +342,8 @@ class MasterAgent:
             else:
                 summary_parts.append("Analysis completed.")
         
-        return "\n".join(summary_parts)
\ No newline at end of file
+        return "\n".join(summary_parts)
+
+def get_master_agent(request: Request) -> MasterAgent:
+    """FastAPI dependency: the single MasterAgent that app.main stores on app.state."""
+    return request.app.state.master_agent
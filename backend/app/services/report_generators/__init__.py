@@ -1,4 +1,6 @@
 from typing import Dict, Any, List, Optional
+from concurrent.futures import Executor
+import asyncio
 import os
 import json
 from datetime import datetime
@@ -10,6 +12,16 @@ from .excel_generator import ExcelReportGenerator
 
 logger = logging.getLogger(__name__)
 
+# Per-process service used when rendering runs inside a ProcessPoolExecutor worker
+_worker_service = None
+
+def _render_in_worker(output_dir: str, research_data: Dict[str, Any], report_type: str,
+                      filename_prefix: Optional[str]) -> Dict[str, Any]:
+    global _worker_service
+    if _worker_service is None or str(_worker_service.output_dir) != output_dir:
+        _worker_service = ReportService(output_dir)
+    return _worker_service.build_comprehensive_report(research_data, report_type, filename_prefix)
+
 class ReportService:
     """
     Main service for generating comprehensive reports
@@ -22,21 +34,42 @@ class ReportService:
         self.excel_generator = ExcelReportGenerator(str(self.output_dir))
     
     async def generate_comprehensive_report(
+        self,
+        research_data: Dict[str, Any],
+        report_type: str = "both",
+        filename_prefix: Optional[str] = None,
+        executor: Optional[Executor] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate comprehensive research report.
+        PDF/Excel rendering is CPU-bound; pass a ProcessPoolExecutor to keep it off the event loop.
+        """
+        if executor is None:
+            return self.build_comprehensive_report(research_data, report_type, filename_prefix)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, _render_in_worker, str(self.output_dir), research_data, report_type, filename_prefix
+        )
+    
+    def build_comprehensive_report(
         self,
         research_data: Dict[str, Any],
         report_type: str = "both",
         filename_prefix: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        Generate comprehensive research report
+        Synchronously render the requested report files
         """
         try:
             # Prepare report data
             report_data = self._prepare_report_data(research_data)
+            # One clock read per report: shared by generated_at and every output filename
+            now = datetime.now()
+            timestamp = now.strftime("%Y%m%d_%H%M%S")
             
             results = {
                 "report_type": report_type,
-                "generated_at": datetime.now().isoformat(),
+                "generated_at": now.isoformat(),
                 "files": [],
                 "metadata": {
                     "query": report_data.get("query", ""),
@@ -48,7 +81,7 @@ class ReportService:
             
             # Generate PDF report
             if report_type in ["pdf", "both"]:
-                pdf_filename = self._generate_filename("pdf", filename_prefix)
+                pdf_filename = self._generate_filename("pdf", filename_prefix, timestamp)
                 pdf_path = self.pdf_generator.generate_research_report(report_data, pdf_filename)
                 results["files"].append({
                     "type": "pdf",
@@ -59,7 +92,7 @@ class ReportService:
             
             # Generate Excel report
             if report_type in ["excel", "both"]:
-                excel_filename = self._generate_filename("xlsx", filename_prefix)
+                excel_filename = self._generate_filename("xlsx", filename_prefix, timestamp)
                 excel_path = self.excel_generator.generate_research_report(report_data, excel_filename)
                 results["files"].append({
                     "type": "excel",
@@ -363,9 +396,10 @@ class ReportService:
         
         return next_steps
     
-    def _generate_filename(self, extension: str, prefix: Optional[str] = None) -> str:
+    def _generate_filename(self, extension: str, prefix: Optional[str] = None, timestamp: Optional[str] = None) -> str:
         """Generate filename for report"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         if prefix:
             return f"{prefix}_{timestamp}.{extension}"
@@ -1,7 +1,7 @@
 from typing import Dict, Any
 from sqlalchemy.orm import Session
 from app.services.research_pipeline import build_pipeline
-from app.models.schemas import ResearchState
+from app.models.schemas import ResearchState, Evidence
 from .base_agent import BaseAgent
 
 class DeepResearchAgent(BaseAgent):
@@ -38,10 +38,7 @@ class DeepResearchAgent(BaseAgent):
             result = await self.pipeline.ainvoke(initial_state)
             
             # Format results
-            evidence_data = [
-                {"source": e.source, "finding": e.finding, "rank": e.rank}
-                for e in result.get("evidence", [])
-            ]
+            evidence_data = Evidence.dump_many(result.get("evidence", []))
             
             data = {
                 "biological_focus": result.get("biological_focus"),
@@ -1,6 +1,7 @@
 # Run with: streamlit run streamlit_app.py
 
 import streamlit as st
+import asyncio
 import sys
 import os
 import pandas as pd
@@ -48,8 +49,8 @@ if st.button("Run Validation Pipeline"):
         )
 
         with st.spinner("Agents are analyzing scientific evidence..."):
-            # Invoke the pipeline
-            result = pipeline.invoke(initial_state)
+            # Invoke the pipeline; the literature node is async, so run it on an event loop
+            result = asyncio.run(pipeline.ainvoke(initial_state))
 
         st.subheader("Evidence Trace")
         for e in result.get("evidence", []):
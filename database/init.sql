@@ -138,7 +138,10 @@ CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_research_sessions_user_id ON research_sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id);
 CREATE INDEX IF NOT EXISTS idx_agent_results_session_id ON agent_results(session_id);
+CREATE INDEX IF NOT EXISTS ix_agent_result_data_gin ON agent_results USING GIN (result_data);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_created ON chat_messages(session_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_reports_user_id ON reports(user_id);
+CREATE INDEX IF NOT EXISTS idx_reports_session_id ON reports(session_id);
 CREATE INDEX IF NOT EXISTS idx_drugs_name ON drugs(name);
 CREATE INDEX IF NOT EXISTS idx_clinical_trials_nct_id ON clinical_trials(nct_id);
 CREATE INDEX IF NOT EXISTS idx_patents_patent_number ON patents(patent_number);